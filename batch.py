@@ -0,0 +1,190 @@
+import argparse
+import hashlib
+import io
+import json
+import logging
+import os
+import sys
+import time
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import cache
+import metrics
+import ocr_engine
+import pipeline
+import uploads
+
+logger = logging.getLogger(__name__)
+
+# --- CONFIGURATION ---
+# Documents analyzed at once. Their pages share the OCR process pool and
+# their clauses share classifier micro-batches, so this can exceed the cores.
+BATCH_DOCUMENTS = int(os.environ.get("LEGALLENS_BATCH_DOCUMENTS", ocr_engine.OCR_WORKERS))
+# Cap on an uploaded zip archive (each document in it is capped like /analyze)
+BATCH_MAX_UPLOAD_BYTES = int(os.environ.get("LEGALLENS_BATCH_MAX_UPLOAD_MB", 500)) * 1024 * 1024
+
+SUPPORTED_EXTENSIONS = (".pdf", ".png", ".jpg", ".jpeg", ".tif", ".tiff", ".bmp", ".webp")
+
+
+class LocalFile:
+    """A document already on disk (CLI input): hashed in place, never copied"""
+
+    def __init__(self, path, filename=None):
+        self.filename = filename or path
+        self.path = path
+        self.source = path
+
+        hasher = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(uploads.CHUNK_SIZE), b""):
+                hasher.update(chunk)
+        self.content_hash = hasher.hexdigest()
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def is_supported(name):
+    return name.lower().endswith(SUPPORTED_EXTENSIONS)
+
+
+def is_zip(source):
+    """True for a zip archive, given as bytes or a path (checked by magic bytes)"""
+    if isinstance(source, (bytes, bytearray)):
+        return bytes(source[:4]) == b"PK\x03\x04"
+    with open(source, "rb") as f:
+        return f.read(4) == b"PK\x03\x04"
+
+
+def iter_zip(archive, max_bytes=uploads.MAX_UPLOAD_BYTES):
+    """
+    (filename, opener) for every supported document in a zip (bytes or path).
+    Members are extracted one at a time, when their opener is called, and
+    stream through uploads.receive so the per-document size cap still applies.
+    """
+    fileobj = io.BytesIO(archive) if isinstance(archive, (bytes, bytearray)) else archive
+    # Not a `with`: the openers outlive this generator and keep the archive open
+    zf = zipfile.ZipFile(fileobj)
+    for info in zf.infolist():
+        name = info.filename
+        if info.is_dir() or name.startswith("__MACOSX/") or not is_supported(name):
+            continue
+
+        def opener(name=name):
+            with zf.open(name) as member:
+                return uploads.receive(member, name, max_bytes)
+
+        yield name, opener
+
+
+def iter_directory(path, recursive=False):
+    """(relative filename, opener) for every supported document under `path`"""
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for name in sorted(files):
+            if is_supported(name):
+                full = os.path.join(root, name)
+                yield os.path.relpath(full, path), (lambda full=full: LocalFile(full))
+        if not recursive:
+            break
+
+
+def analyze_one(filename, opener, service, result_cache=None):
+    """One document end to end; returns its JSON line (a result or an error)"""
+    start = time.perf_counter()
+    try:
+        with opener() as document:
+            key = cache.make_key(document.content_hash, *service.versions())
+            cached = result_cache.get(key) if result_cache is not None else None
+            if cached is not None:
+                return {**cached, "filename": filename, "fingerprint": document.content_hash,
+                        "cached": True, "seconds": round(time.perf_counter() - start, 3)}
+
+            # The scheduler batches these clauses with the other documents'
+            result = pipeline.analyze(
+                document.source, filename, service.inference, service.judge,
+                metrics.RequestTimings(), service.matcher, service.clauses, document.content_hash
+            )
+            if result_cache is not None:
+                result_cache.put(key, result)
+
+        return {**result, "seconds": round(time.perf_counter() - start, 3)}
+
+    except Exception as e:
+        logger.warning("⚠️ %s failed: %s", filename, e)
+        return {"filename": filename, "error": str(e)}
+
+
+def iter_results(documents, service, result_cache=None, concurrency=BATCH_DOCUMENTS):
+    """
+    Analyzes (filename, opener) pairs with `concurrency` documents in flight
+    and yields each document's result as soon as it finishes (completion
+    order; every line carries its filename). Documents are only opened
+    when they start, so memory stays bounded for any batch size.
+    """
+    documents = iter(documents)
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="batch") as pool:
+        running = set()
+        exhausted = False
+
+        while running or not exhausted:
+            while not exhausted and len(running) < concurrency:
+                item = next(documents, None)
+                if item is None:
+                    exhausted = True
+                    break
+                running.add(pool.submit(analyze_one, *item, service, result_cache))
+
+            if running:
+                done, running = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+
+
+def to_json_line(result):
+    return json.dumps(result) + "\n"
+
+# --- COMMAND LINE ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Analyze every contract in a directory (or zip), one JSON line per document.")
+    parser.add_argument("path", help="Directory of PDFs/images, a .zip archive, or a single document")
+    parser.add_argument("-o", "--output", help="Write JSON lines here (default: stdout)")
+    parser.add_argument("-r", "--recursive", action="store_true", help="Descend into subdirectories")
+    parser.add_argument("-j", "--concurrency", type=int, default=BATCH_DOCUMENTS, help="Documents in flight")
+    parser.add_argument("--no-cache", action="store_true", help="Ignore and don't fill the result cache")
+    args = parser.parse_args()
+
+    metrics.setup_logging()
+    from models import models
+    models.start()
+
+    if os.path.isdir(args.path):
+        documents = iter_directory(args.path, args.recursive)
+    elif is_zip(args.path):
+        documents = iter_zip(args.path)
+    else:
+        documents = [(args.path, lambda: LocalFile(args.path))]
+
+    out = open(args.output, "w") if args.output else sys.stdout
+    result_cache = None if args.no_cache else cache.ResultCache()
+    start = time.perf_counter()
+    count = failed = 0
+
+    try:
+        for result in iter_results(documents, models, result_cache, args.concurrency):
+            out.write(to_json_line(result))
+            out.flush()
+            count += 1
+            failed += "error" in result
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    logger.info("✅ %d documents (%d failed) in %.1fs", count, failed, time.perf_counter() - start)
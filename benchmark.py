@@ -0,0 +1,506 @@
+import argparse
+import io
+import json
+import platform
+import random
+import re
+import subprocess
+import textwrap
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+from PIL import Image
+
+import ocr_engine
+import pipeline
+import preprocess
+from train_classifier import train_data
+
+# --- CONFIGURATION ---
+PAGE_SIZE = (2550, 3300)      # US Letter at 300 DPI (w, h)
+MARGIN = 150
+LINE_HEIGHT = 48
+WRAP_CHARS = 90
+STAGES = ("preprocess", "ocr", "text_layer", "classify", "risk", "rules", "pipeline", "http")
+# Randomized (label, clause) pairs the rules stage checks against the legacy judge
+RULE_CASES = 50_000
+
+
+# --- 1. SYNTHETIC CONTRACTS ---
+
+def make_clauses(rng, count):
+    """Numbered lease clauses built from the training sentences (1-3 each)"""
+    sentences = [text for text, _ in train_data]
+    clauses = []
+    for number in range(1, count + 1):
+        body = " ".join(rng.choice(sentences) for _ in range(rng.randint(1, 3)))
+        clauses.append(f"{number}. {body}")
+    return clauses
+
+
+def layout_pages(clauses, pages):
+    """Wraps clauses into lines and spreads them over `pages` pages"""
+    lines_per_page = (PAGE_SIZE[1] - 2 * MARGIN) // LINE_HEIGHT
+    lines = []
+    for clause in clauses:
+        lines.extend(textwrap.wrap(clause, WRAP_CHARS))
+        lines.append("")   # paragraph gap
+
+    layout = [lines[i:i + lines_per_page] for i in range(0, len(lines), lines_per_page)]
+    return (layout + [[] for _ in range(pages)])[:pages]
+
+
+def render_page(lines, rng, skew=0.0, noise=0.0):
+    """Draws one page as a grayscale scan, optionally rotated and grainy"""
+    w, h = PAGE_SIZE
+    page = np.full((h, w), 255, dtype=np.uint8)
+    for i, line in enumerate(lines):
+        y = MARGIN + (i + 1) * LINE_HEIGHT
+        cv2.putText(page, line, (MARGIN, y), cv2.FONT_HERSHEY_SIMPLEX, 1.1, 0, 2, cv2.LINE_AA)
+
+    if skew:
+        angle = rng.uniform(-skew, skew)
+        M = cv2.getRotationMatrix2D((w // 2, h // 2), angle, 1.0)
+        page = cv2.warpAffine(page, M, (w, h), borderValue=255)
+
+    if noise:
+        grain = np.random.default_rng(rng.randint(0, 2**31)).normal(0, noise, page.shape)
+        page = np.clip(page + grain, 0, 255).astype(np.uint8)
+
+    return page
+
+
+def encode_png(page):
+    return cv2.imencode(".png", page)[1].tobytes()
+
+
+def encode_scanned_pdf(pages):
+    """Image-only PDF (what a scanner produces): every page needs OCR"""
+    images = [Image.fromarray(page) for page in pages]
+    buffer = io.BytesIO()
+    images[0].save(buffer, "PDF", save_all=True, append_images=images[1:], resolution=300)
+    return buffer.getvalue()
+
+
+def _pdf_escape(text):
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def encode_digital_pdf(layout):
+    """
+    Born-digital PDF with a real text layer (Helvetica, one text object per
+    line). Hand-written so the benchmark needs no PDF library.
+    """
+    scale = 72 / 300
+    width, height = PAGE_SIZE[0] * scale, PAGE_SIZE[1] * scale
+    page_count = len(layout)
+
+    # 1: catalog, 2: pages, 3: font, then (page, content) pairs
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        ("<< /Type /Pages /Kids [%s] /Count %d >>" % (
+            " ".join(f"{4 + 2 * i} 0 R" for i in range(page_count)), page_count)).encode(),
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    for i, lines in enumerate(layout):
+        ops = ["BT", "/F1 10 Tf"]
+        for n, line in enumerate(lines):
+            y = height - (MARGIN + (n + 1) * LINE_HEIGHT) * scale
+            ops.append(f"1 0 0 1 {MARGIN * scale:.2f} {y:.2f} Tm ({_pdf_escape(line)}) Tj")
+        ops.append("ET")
+        stream = "\n".join(ops).encode("latin-1", "replace")
+
+        objects.append((
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {width:.2f} {height:.2f}] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {5 + 2 * i} 0 R >>"
+        ).encode())
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+
+    out = io.BytesIO()
+    out.write(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(out.tell())
+        out.write(b"%d 0 obj\n" % number + body + b"\nendobj\n")
+
+    xref = out.tell()
+    out.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+    for offset in offsets:
+        out.write(b"%010d 00000 n \n" % offset)
+    out.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref))
+    return out.getvalue()
+
+
+def make_corpus(docs, pages, skew, noise, seed):
+    """Deterministic set of synthetic leases in every input format"""
+    rng = random.Random(seed)
+    lines_per_page = (PAGE_SIZE[1] - 2 * MARGIN) // LINE_HEIGHT
+    corpus = []
+
+    for _ in range(docs):
+        # ~4 wrapped lines per clause incl. the gap
+        clauses = make_clauses(rng, max(pages * lines_per_page // 4, 1))
+        layout = layout_pages(clauses, pages)
+        images = [render_page(lines, rng, skew, noise) for lines in layout]
+        corpus.append({
+            "clauses": clauses,
+            "pages": images,
+            "png": encode_png(images[0]),
+            "scanned_pdf": encode_scanned_pdf(images),
+            "digital_pdf": encode_digital_pdf(layout),
+        })
+
+    return corpus
+
+
+# --- 2. MEASUREMENT ---
+
+def percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * q / 100
+    low, high = int(np.floor(rank)), int(np.ceil(rank))
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def summarize(latencies, pages, wall_seconds):
+    return {
+        "samples": len(latencies),
+        "pages": pages,
+        "wall_seconds": round(wall_seconds, 4),
+        "pages_per_sec": round(pages / wall_seconds, 3) if wall_seconds else None,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2) if latencies else None,
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2) if latencies else None,
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2) if latencies else None,
+    }
+
+
+def timed_runs(fn, items, pages_per_item=1):
+    latencies = []
+    start = time.perf_counter()
+    for item in items:
+        t0 = time.perf_counter()
+        fn(item)
+        latencies.append(time.perf_counter() - t0)
+    return summarize(latencies, pages_per_item * len(items), time.perf_counter() - start)
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process and of its (OCR pool) children"""
+    try:
+        import resource   # Unix only
+    except ImportError:
+        return _peak_rss_psutil()
+
+    to_mb = 1 / 1024 if platform.system() == "Linux" else 1 / (1024 * 1024)
+    return {
+        "self": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * to_mb, 1),
+        "children": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * to_mb, 1),
+    }
+
+
+def _peak_rss_psutil():
+    """Windows: peak working set via psutil; finished children are not tracked there"""
+    try:
+        import psutil
+    except ImportError:
+        return {"self": None, "children": None}
+
+    info = psutil.Process().memory_info()
+    peak = getattr(info, "peak_wset", info.rss)
+    return {"self": round(peak / (1024 * 1024), 1), "children": None}
+
+
+# --- 3. STAGES ---
+
+def bench_preprocess(corpus, args):
+    pages = [page for doc in corpus for page in doc["pages"]]
+    return timed_runs(preprocess.preprocess_image, pages)
+
+
+def bench_ocr(corpus, args):
+    cleaned = [preprocess.preprocess_image(page) for doc in corpus for page in doc["pages"]]
+    return {
+        "tesseract": timed_runs(ocr_engine.ocr_image, cleaned),
+        "scanned_pdf": timed_runs(pipeline.ocr_document, [doc["scanned_pdf"] for doc in corpus], args.pages),
+    }
+
+
+def bench_text_layer(corpus, args):
+    return timed_runs(pipeline.ocr_document, [doc["digital_pdf"] for doc in corpus], args.pages)
+
+
+def bench_classify(corpus, args, classifier):
+    return timed_runs(classifier.classify_batch, [doc["clauses"] for doc in corpus], args.pages)
+
+
+def bench_risk(corpus, args, classifier, judge):
+    labelled = []
+    for doc in corpus:
+        labels = [label for label, _, _ in classifier.classify_batch(doc["clauses"])]
+        labelled.append((labels, doc["clauses"]))
+    return timed_runs(lambda item: judge.analyze_batch(*item), labelled, args.pages)
+
+
+def legacy_verdict(label, text):
+    """
+    The judge as it was before the rule table (chained substring checks),
+    plus the pipeline's safety-net test. Kept as the parity reference.
+    """
+    text_lower = text.lower()
+    numbers = re.findall(r"\d+", text)
+    number = float(numbers[0]) if numbers else 0
+    safety_net = any(word in text_lower for word in ['terminate', 'indemnify', 'increase', 'retain', 'evict', 'penalty'])
+    risk_score = 0
+    reasons = []
+
+    if label == "Notice":
+        days = number * 30 if "month" in text_lower else number
+        if 0 < days < 30:
+            risk_score = 85
+            reasons.append(f"Notice period of {int(days)} days is too short (Standard: 30+ days).")
+        elif "waived" in text_lower or "immediate" in text_lower:
+            risk_score = 95
+            reasons.append("Clause suggests Notice Period can be waived/immediate (High Risk).")
+    elif label == "Deposit":
+        if "rupees" in text_lower or "rs" in text_lower:
+            pass
+        elif number > 3:
+            risk_score = 80
+            reasons.append(f"Security deposit of {int(number)} months is high (Standard: 2-3 months).")
+        elif "non-refundable" in text_lower:
+            risk_score = 100
+            reasons.append("Deposit is marked as 'Non-Refundable'. This is illegal in many jurisdictions.")
+    elif label == "Indemnity":
+        if "all losses" in text_lower or "any damage" in text_lower:
+            risk_score = 75
+            reasons.append("Broad indemnity clause: Makes you liable for 'all' damages, even accidental.")
+        if "tenant's cost" in text_lower:
+            risk_score = 60
+            reasons.append("Forces tenant to pay for repairs that might be structural.")
+    elif label == "Termination":
+        if "at will" in text_lower or "without cause" in text_lower:
+            risk_score = 90
+            reasons.append("Landlord can terminate 'at will' (Unstable tenancy).")
+        if "forfeit" in text_lower:
+            risk_score = 80
+            reasons.append("Clause mentions forfeiture of deposit on termination.")
+
+    if risk_score == 0:
+        verdict = {"score": 10, "level": "Low Risk", "explanation": "Clause appears standard."}
+    elif risk_score < 70:
+        verdict = {"score": risk_score, "level": "Medium Risk", "explanation": " ".join(reasons)}
+    else:
+        verdict = {"score": risk_score, "level": "High Risk", "explanation": " ".join(reasons)}
+    return safety_net, verdict
+
+
+def rule_cases(corpus, count, seed):
+    """Clauses with keywords, numbers and case changes spliced in at random spots"""
+    import risk_detector
+
+    rng = random.Random(seed)
+    clauses = [clause for doc in corpus for clause in doc["clauses"]]
+    keywords = sorted({kw for table in risk_detector.RULES.values() for rule in table["rules"]
+                       for kw in rule.get("keywords", [])} | set(risk_detector.SAFETY_NET_WORDS) | {"month"})
+    labels = sorted(risk_detector.RULES) + ["Potential Clause", "Rent"]
+    cases = []
+    for _ in range(count):
+        text = rng.choice(clauses)
+        for _ in range(rng.randint(0, 4)):
+            piece = rng.choice(keywords + [str(rng.randint(0, 120))])
+            piece = piece.upper() if rng.random() < 0.2 else piece
+            at = rng.randint(0, len(text))
+            # Glued on without a space half the time: overlapping/partial keywords
+            glue = "" if rng.random() < 0.5 else " "
+            text = text[:at] + glue + piece + glue + text[at:]
+        cases.append((rng.choice(labels), text))
+    return cases
+
+
+def bench_rules(corpus, args, judge):
+    """
+    The compiled judge (one scan shared by the safety net and the rules)
+    against the legacy substring checks: speed on the same cases, and
+    verdict parity on every one of them.
+    """
+    cases = rule_cases(corpus, args.rule_cases, args.seed)
+
+    def compiled():
+        judge.scan.cache_clear()
+        out = []
+        for label, text in cases:
+            scan = judge.scan(text)
+            out.append((judge.needs_safety_net(scan), judge.analyze_risk(label, text, scan)))
+        return out
+
+    def legacy():
+        return [legacy_verdict(label, text) for label, text in cases]
+
+    # Best of three: the runs are short and the machine is noisy
+    timings = {}
+    for name, fn in (("legacy", legacy), ("compiled", compiled)):
+        best = None
+        for _ in range(3):
+            start = time.perf_counter()
+            verdicts = fn()
+            seconds = time.perf_counter() - start
+            best = seconds if best is None else min(best, seconds)
+        timings[name] = (verdicts, best)
+
+    mismatches = [(case, old, new) for case, old, new in
+                  zip(cases, timings["legacy"][0], timings["compiled"][0]) if old != new]
+    if mismatches:
+        print(f"❌ Rules disagree with the legacy judge on {len(mismatches)} case(s), e.g. {mismatches[0]}")
+    return {
+        "cases": len(cases),
+        "engine": "aho-corasick" if judge._automaton is not None else "regex",
+        "legacy_ms": round(timings["legacy"][1] * 1000, 2),
+        "compiled_ms": round(timings["compiled"][1] * 1000, 2),
+        "speedup": round(timings["legacy"][1] / timings["compiled"][1], 2),
+        "mismatches": len(mismatches),
+    }
+
+
+def bench_pipeline(corpus, args, classifier, judge):
+    """
+    The whole in-process pipeline at each --concurrency level: documents
+    share the OCR pool and, through the micro-batching scheduler, the
+    classifier batches, as in the service (no HTTP, no result cache).
+    """
+    from inference import InferenceScheduler
+
+    scheduler = InferenceScheduler(classifier)
+    results = {}
+
+    for fmt in ("scanned_pdf", "digital_pdf"):
+        results[fmt] = {}
+        for level in args.concurrency:
+            documents = [corpus[i % len(corpus)][fmt] for i in range(max(level * 2, len(corpus)))]
+
+            def analyze(data):
+                t0 = time.perf_counter()
+                pipeline.analyze(data, "bench.pdf", scheduler, judge)
+                return time.perf_counter() - t0
+
+            with ThreadPoolExecutor(max_workers=level) as pool:
+                start = time.perf_counter()
+                latencies = list(pool.map(analyze, documents))
+                wall = time.perf_counter() - start
+
+            results[fmt][f"c{level}"] = summarize(latencies, args.pages * len(documents), wall)
+
+    return results
+
+
+def _unique(data, rng):
+    """Trailing comment bytes (ignored by PDF readers) defeat the result cache"""
+    return data + b"\n%% bench-%d\n" % rng.getrandbits(64)
+
+
+def bench_http(corpus, args):
+    import httpx
+
+    rng = random.Random(args.seed)
+    results = {}
+
+    for fmt in ("scanned_pdf", "digital_pdf"):
+        results[fmt] = {}
+        for level in args.concurrency:
+            uploads = [_unique(corpus[i % len(corpus)][fmt], rng) for i in range(max(level * 2, len(corpus)))]
+
+            def send(data):
+                t0 = time.perf_counter()
+                response = client.post(f"{args.url}/analyze", files={"file": ("bench.pdf", data, "application/pdf")})
+                return time.perf_counter() - t0, response.status_code
+
+            with httpx.Client(timeout=args.timeout) as client, ThreadPoolExecutor(max_workers=level) as pool:
+                start = time.perf_counter()
+                outcomes = list(pool.map(send, uploads))
+                wall = time.perf_counter() - start
+
+            ok = [latency for latency, status in outcomes if status == 200]
+            summary = summarize(ok, args.pages * len(ok), wall)
+            summary["errors"] = len(outcomes) - len(ok)
+            results[fmt][f"c{level}"] = summary
+
+    return results
+
+
+# --- 4. ENTRY POINT ---
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    print(f"🏗️  Generating {args.docs} synthetic lease(s) of {args.pages} page(s)...")
+    corpus = make_corpus(args.docs, args.pages, args.skew, args.noise, args.seed)
+
+    classifier = judge = None
+    if {"classify", "risk", "pipeline"} & set(args.stages):
+        from classifier import ClauseClassifier
+        from risk_detector import RiskDetector
+        classifier, judge = ClauseClassifier(), RiskDetector()
+
+    # The rules stage needs no model
+    rules_judge = judge
+    if "rules" in args.stages and rules_judge is None:
+        from risk_detector import RiskDetector
+        rules_judge = RiskDetector()
+
+    runners = {
+        "preprocess": lambda: bench_preprocess(corpus, args),
+        "ocr": lambda: bench_ocr(corpus, args),
+        "text_layer": lambda: bench_text_layer(corpus, args),
+        "classify": lambda: bench_classify(corpus, args, classifier),
+        "risk": lambda: bench_risk(corpus, args, classifier, judge),
+        "rules": lambda: bench_rules(corpus, args, rules_judge),
+        "pipeline": lambda: bench_pipeline(corpus, args, classifier, judge),
+        "http": lambda: bench_http(corpus, args),
+    }
+
+    report = {
+        "revision": git_revision(),
+        "config": {k: v for k, v in vars(args).items() if k != "output"},
+        "stages": {},
+    }
+    for stage in args.stages:
+        if stage == "http" and not args.url:
+            continue
+        print(f"⏱️  {stage}...")
+        report["stages"][stage] = runners[stage]()
+
+    report["peak_rss_mb"] = peak_rss_mb()
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="LegalLens end-to-end benchmark on synthetic contracts.")
+    parser.add_argument("--docs", type=int, default=3)
+    parser.add_argument("--pages", type=int, default=2, help="Pages per document")
+    parser.add_argument("--skew", type=float, default=2.0, help="Max random page rotation (degrees)")
+    parser.add_argument("--noise", type=float, default=6.0, help="Gaussian grain sigma (grey levels)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--stages", nargs="+", default=list(STAGES), choices=STAGES)
+    parser.add_argument("--rule-cases", type=int, default=RULE_CASES, help="Cases for the rules parity check")
+    parser.add_argument("--url", help="Base URL of a running service for the http stage, e.g. http://localhost:8000")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8],
+                        help="Documents in flight, for the pipeline and http stages")
+    parser.add_argument("--timeout", type=float, default=600)
+    parser.add_argument("--output", help="Write the JSON report here (default: stdout)")
+    args = parser.parse_args()
+
+    report = json.dumps(run(args), indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report)
+        print(f"✅ Report saved to {args.output}")
+    else:
+        print(report)
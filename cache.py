@@ -0,0 +1,247 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# --- CONFIGURATION ---
+CACHE_DIR = os.environ.get("LEGALLENS_CACHE_DIR", "./cache")
+MEMORY_ITEMS = int(os.environ.get("LEGALLENS_CACHE_MEMORY_ITEMS", 128))
+DISK_MAX_BYTES = int(os.environ.get("LEGALLENS_CACHE_DISK_MB", 512)) * 1024 * 1024
+
+# Bump when the shape of a cached /analyze response changes
+SCHEMA_VERSION = 4
+
+
+def make_key(content_hash, *versions):
+    """
+    Cache key = document bytes + everything that can change the verdict
+    (model version, risk rule set, response schema).
+    """
+    parts = [content_hash, str(SCHEMA_VERSION)] + [str(v) for v in versions]
+    return hashlib.sha256("|".join(parts).encode()).hexdigest()
+
+
+class LazyConnection:
+    """
+    A SQLite connection opened on first use, once per process. A connection
+    must not be used across fork() (gunicorn --preload), so a store built
+    in the master opens its own connection in every worker.
+    `setup(db)` creates the schema on a fresh connection.
+    """
+
+    def __init__(self, path, setup=None, row_factory=None):
+        self.path = path
+        self.setup = setup
+        self.row_factory = row_factory
+        self._db = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def __call__(self):
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    # An inherited connection is left alone (not even closed)
+                    db = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+                    if self.row_factory is not None:
+                        db.row_factory = self.row_factory
+                    db.execute("PRAGMA journal_mode=WAL")
+                    if self.setup is not None:
+                        self.setup(db)
+                    db.commit()
+                    self._db, self._pid = db, os.getpid()
+        return self._db
+
+
+class MemoryLRU:
+    """Tier 1: a small in-process LRU of recent results"""
+
+    def __init__(self, max_items=MEMORY_ITEMS):
+        self.max_items = max_items
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._items:
+                return None
+            self._items.move_to_end(key)
+            return self._items[key]
+
+    def put(self, key, value):
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+
+    def get_many(self, keys):
+        return {key: value for key in keys if (value := self.get(key)) is not None}
+
+    def put_many(self, items):
+        for key, value in items.items():
+            self.put(key, value)
+
+    def __len__(self):
+        return len(self._items)
+
+
+class SQLiteStore:
+    """
+    Tier 2: results on disk, shared by all workers on the node.
+    Least recently used entries are evicted once the stored JSON
+    exceeds `max_bytes`.
+    """
+
+    def __init__(self, path=None, max_bytes=DISK_MAX_BYTES):
+        if path is None:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            path = os.path.join(CACHE_DIR, "results.sqlite3")
+
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._connection = LazyConnection(path, self._setup)
+
+    @property
+    def _db(self):
+        return self._connection()
+
+    @staticmethod
+    def _setup(db):
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL,"
+            " size INTEGER NOT NULL, accessed REAL NOT NULL)"
+        )
+        db.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)")
+
+    def get(self, key):
+        with self._lock:
+            row = self._db.execute("SELECT value FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self._db.execute("UPDATE entries SET accessed = ? WHERE key = ?", (time.time(), key))
+            self._db.commit()
+        return json.loads(row[0])
+
+    def put(self, key, value):
+        payload = json.dumps(value)
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO entries (key, value, size, accessed) VALUES (?, ?, ?, ?)",
+                (key, payload, len(payload), time.time())
+            )
+            self._evict()
+            self._db.commit()
+
+    def get_many(self, keys):
+        """One query (per 500 keys) instead of one per key"""
+        keys = list(dict.fromkeys(keys))
+        found = {}
+        with self._lock:
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                rows = self._db.execute(
+                    f"SELECT key, value FROM entries WHERE key IN ({','.join('?' * len(chunk))})", chunk
+                ).fetchall()
+                found.update(rows)
+            if found:
+                now = time.time()
+                self._db.executemany("UPDATE entries SET accessed = ? WHERE key = ?", [(now, key) for key in found])
+                self._db.commit()
+        return {key: json.loads(value) for key, value in found.items()}
+
+    def put_many(self, items):
+        now = time.time()
+        rows = [(key, payload, len(payload), now) for key, payload in
+                ((key, json.dumps(value)) for key, value in items.items())]
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO entries (key, value, size, accessed) VALUES (?, ?, ?, ?)", rows
+            )
+            self._evict()
+            self._db.commit()
+
+    def _evict(self):
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        while total > self.max_bytes:
+            row = self._db.execute("SELECT key, size FROM entries ORDER BY accessed LIMIT 1").fetchone()
+            if row is None:
+                break
+            self._db.execute("DELETE FROM entries WHERE key = ?", (row[0],))
+            total -= row[1]
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+
+class ResultCache:
+    """
+    Read-through cache over a list of tiers, fastest first.
+    A hit in a slower tier is promoted into the faster ones.
+    Any object with get(key) / put(key, value) can be used as a tier.
+    """
+
+    def __init__(self, tiers=None):
+        self.tiers = tiers if tiers is not None else [MemoryLRU(), SQLiteStore()]
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        for level, tier in enumerate(self.tiers):
+            value = tier.get(key)
+            if value is not None:
+                for faster in self.tiers[:level]:
+                    faster.put(key, value)
+                self._count(hit=True)
+                return value
+
+        self._count(hit=False)
+        return None
+
+    def put(self, key, value):
+        for tier in self.tiers:
+            tier.put(key, value)
+
+    def get_many(self, keys):
+        """{key: value} for the keys found in any tier; tiers need get_many/put_many"""
+        keys = list(keys)
+        found = {}
+        for level, tier in enumerate(self.tiers):
+            missing = [key for key in keys if key not in found]
+            if not missing:
+                break
+            hits = tier.get_many(missing)
+            for faster in self.tiers[:level]:
+                faster.put_many(hits)
+            found.update(hits)
+
+        self._count(hit=True, n=len(found))
+        self._count(hit=False, n=len(set(keys)) - len(found))
+        return found
+
+    def put_many(self, items):
+        if items:
+            for tier in self.tiers:
+                tier.put_many(items)
+
+    def _count(self, hit, n=1):
+        with self._lock:
+            if hit:
+                self.hits += n
+            else:
+                self.misses += n
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "entries": {type(tier).__name__: len(tier) for tier in self.tiers},
+        }
@@ -0,0 +1,332 @@
+import hashlib
+import io
+import json
+import logging
+import os
+import re
+import threading
+import zlib
+
+import numpy as np
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# --- CONFIGURATION ---
+# Set LEGALLENS_CASCADE=0 to send every clause to the transformer
+ENABLED = os.environ.get("LEGALLENS_CASCADE", "1") == "1"
+# Written by train_classifier.py next to the transformer it was trained with
+PREFILTER_PATH = os.environ.get("LEGALLENS_CASCADE_PATH", "./saved_models/clause_model/cascade.npz")
+# A block at least this likely to be noise (header, signature, address, page
+# number) is dismissed without the transformer...
+DISMISS_THRESHOLD = float(os.environ.get("LEGALLENS_CASCADE_DISMISS", 0.90))
+# ...and a clause whose label is at least this likely keeps the prefilter's label.
+# Everything in between is escalated. Set either to >1 to disable that exit.
+ACCEPT_THRESHOLD = float(os.environ.get("LEGALLENS_CASCADE_ACCEPT", 0.95))
+
+# Hashed feature space (word 1-2 grams + a few layout features)
+N_FEATURES = 2 ** 18
+# The prefilter's extra class, next to the taxonomy labels
+NOISE = "Not a Clause"
+
+# Blocks that are not clauses, as OCR finds them on rental agreements.
+# Training data may add more under the NOISE label.
+NOISE_EXAMPLES = [
+    "RENTAL AGREEMENT",
+    "LEAVE AND LICENSE AGREEMENT",
+    "LEASE DEED",
+    "THIS AGREEMENT IS MADE AND EXECUTED AT MUMBAI",
+    "Page 1 of 4",
+    "Page 3",
+    "- 2 -",
+    "Contd...",
+    "IN WITNESS WHEREOF the parties have set their hands on the day and year first above written.",
+    "WITNESSES:",
+    "1. Witness Name and Signature",
+    "Signature of the Landlord",
+    "Signature of the Tenant",
+    "(LICENSOR) (LICENSEE)",
+    "SIGNED AND DELIVERED by the within named Lessor",
+    "Mr. Ramesh Kumar, S/o Late Shri Mohan Lal, aged 54 years",
+    "Residing at Flat No. 12, Green Park Apartments, Andheri West, Mumbai 400058",
+    "House No. 221, Sector 15, Gurgaon, Haryana - 122001",
+    "hereinafter called the LANDLORD of the ONE PART",
+    "AND hereinafter called the TENANT of the OTHER PART",
+    "PAN: ABCDE1234F Aadhaar: 1234 5678 9012",
+    "Date: 01/04/2024 Place: Bengaluru",
+    "SCHEDULE OF THE PROPERTY",
+    "ANNEXURE I - LIST OF FIXTURES AND FITTINGS",
+    "Fans: 4, Tube lights: 6, Geyser: 1, Wardrobes: 2",
+    "NOW THIS AGREEMENT WITNESSETH AS FOLLOWS:",
+    "WHEREAS the Landlord is the absolute owner of the premises described below.",
+    "Stamp duty paid: Rs. 500",
+    "e-Stamp Certificate No. IN-DL12345678901234A",
+    "Notary Public",
+]
+
+EXITS = {"dismiss": "dismissed", "accept": "accepted", "escalate": "escalated"}
+
+_WORDS = re.compile(r"[a-z0-9]+")
+_DIGITS = re.compile(r"\d+")
+
+
+def features(text):
+    """
+    (indices, values) of a text in the hashed feature space: word unigrams
+    and bigrams (numbers folded to one token) plus layout hints that tell
+    headers and signature lines apart from clauses. Log-scaled counts, L2-normalised.
+    """
+    words = _WORDS.findall(_DIGITS.sub("0", text.lower()))
+    letters = [c for c in text if c.isalpha()]
+    grams = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+    grams.append(f"_words:{min(len(words), 40) // 4}")
+    if letters and sum(c.isupper() for c in letters) > 0.8 * len(letters):
+        grams.append("_caps")
+    if text.rstrip().endswith((".", ";")):
+        grams.append("_sentence")
+
+    indices, counts = np.unique(
+        np.fromiter((zlib.crc32(g.encode()) % N_FEATURES for g in grams), dtype=np.int64, count=len(grams)),
+        return_counts=True,
+    )
+    values = 1.0 + np.log(counts.astype(np.float32))
+    return indices, values / np.linalg.norm(values)
+
+
+def _sparse(texts):
+    """Stacks features() of every text: (row offsets, column indices, values)"""
+    rows = [features(text) for text in texts]
+    offsets = np.cumsum([0] + [len(indices) for indices, _ in rows[:-1]])
+    return offsets, np.concatenate([i for i, _ in rows]), np.concatenate([v for _, v in rows])
+
+
+def _softmax(logits):
+    logits = logits - logits.max(axis=1, keepdims=True)
+    np.exp(logits, out=logits)
+    logits /= logits.sum(axis=1, keepdims=True)
+    return logits
+
+
+class Prefilter:
+    """
+    A hashed n-gram softmax regression over the taxonomy labels plus NOISE.
+    Scoring a block is a few hundred row lookups, so a whole document costs
+    less than one transformer forward pass.
+    """
+
+    def __init__(self, weights, bias, labels, version=None):
+        self.weights = weights
+        self.bias = bias
+        self.labels = list(labels)
+        self.noise = self.labels.index(NOISE)
+        self.version = version or "untracked"
+
+    @classmethod
+    def load(cls, path=PREFILTER_PATH):
+        with open(path, "rb") as f:
+            raw = f.read()
+        stored = np.load(io.BytesIO(raw))
+        weights = np.zeros((N_FEATURES, len(stored["bias"])), dtype=np.float32)
+        weights[stored["rows"]] = stored["weights"]
+        return cls(weights, stored["bias"], json.loads(str(stored["labels"])),
+                   hashlib.sha256(raw).hexdigest()[:16])
+
+    def save(self, path):
+        # Only the hashed rows that were seen in training are stored
+        rows = np.flatnonzero(np.any(self.weights != 0, axis=1))
+        np.savez_compressed(path, rows=rows, weights=self.weights[rows], bias=self.bias,
+                            labels=json.dumps(self.labels))
+
+    @classmethod
+    def fit(cls, texts, labels, classes, epochs=300, learning_rate=0.5, l2=1e-4):
+        """Full-batch gradient descent with momentum on the softmax loss"""
+        offsets, cols, vals = _sparse(texts)
+        # Train on the columns that occur only, scattered into the full table at the end
+        used, cols = np.unique(cols, return_inverse=True)
+        rows = np.repeat(np.arange(len(texts)), np.diff(np.append(offsets, len(cols))))
+        target = np.zeros((len(texts), len(classes)), dtype=np.float32)
+        target[np.arange(len(texts)), [classes.index(label) for label in labels]] = 1.0
+
+        weights = np.zeros((len(used), len(classes)), dtype=np.float32)
+        bias = np.zeros(len(classes), dtype=np.float32)
+        velocity_w, velocity_b = np.zeros_like(weights), np.zeros_like(bias)
+
+        for _ in range(epochs):
+            logits = np.add.reduceat(weights[cols] * vals[:, None], offsets, axis=0) + bias
+            error = (_softmax(logits) - target) / len(texts)
+            grad_w = np.zeros_like(weights)
+            np.add.at(grad_w, cols, error[rows] * vals[:, None])
+            grad_w += l2 * weights
+
+            velocity_w = 0.9 * velocity_w - learning_rate * grad_w
+            velocity_b = 0.9 * velocity_b - learning_rate * error.sum(axis=0)
+            weights += velocity_w
+            bias += velocity_b
+
+        full = np.zeros((N_FEATURES, len(classes)), dtype=np.float32)
+        full[used] = weights
+        return cls(full, bias, classes)
+
+    def predict_proba(self, texts):
+        """(texts x classes) probabilities, classes in self.labels order"""
+        if not texts:
+            return np.zeros((0, len(self.labels)), dtype=np.float32)
+        offsets, cols, vals = _sparse(texts)
+        logits = np.add.reduceat(self.weights[cols] * vals[:, None], offsets, axis=0) + self.bias
+        return _softmax(logits)
+
+
+class Cascade:
+    """
+    Early exit in front of the transformer. Every block is scored by the
+    prefilter first:
+      dismiss  : confidently noise -> treated like a low-confidence prediction
+      accept   : confidently one label -> that label, no transformer call
+      escalate : everything else goes to ClauseClassifier as before
+    `guard(text)` True keeps a block from being dismissed (the judge's danger
+    words), so the rules and the transformer still see every risky-looking block.
+    """
+
+    def __init__(self, prefilter, dismiss=DISMISS_THRESHOLD, accept=ACCEPT_THRESHOLD, guard=None):
+        self.prefilter = prefilter
+        self.dismiss = dismiss
+        self.accept = accept
+        self.guard = guard
+        self.version = f"{prefilter.version}-{dismiss:g}-{accept:g}"
+
+        self._lock = threading.Lock()
+        self.counts = {name: 0 for name in EXITS.values()}
+
+    def decide(self, texts):
+        """(outcome, (label, confidence, window)) per text; outcome is dismiss/accept/escalate"""
+        probs = self.prefilter.predict_proba(list(texts))
+        noise = probs[:, self.prefilter.noise].copy()
+        probs[:, self.prefilter.noise] = 0.0
+
+        decisions = []
+        for text, row, p_noise in zip(texts, probs, noise):
+            label_id = int(row.argmax())
+            # The label's probability: low for noise, so assess_risks treats it as no clause
+            prediction = (self.prefilter.labels[label_id], round(float(row[label_id]) * 100, 2), None)
+            if p_noise >= self.dismiss and not (self.guard is not None and self.guard(text)):
+                decisions.append(("dismiss", prediction))
+            elif row[label_id] >= self.accept:
+                decisions.append(("accept", prediction))
+            else:
+                decisions.append(("escalate", None))
+        return decisions
+
+    def route(self, texts):
+        """
+        Returns (decided, escalate): `decided` maps an index to its
+        (label, confidence, window) prediction; `escalate` lists the
+        indices that need the transformer, in order.
+        """
+        decisions = self.decide(texts)
+        decided = {i: prediction for i, (outcome, prediction) in enumerate(decisions) if outcome != "escalate"}
+        escalate = [i for i, (outcome, _) in enumerate(decisions) if outcome == "escalate"]
+
+        if decisions:
+            metrics.CASCADE_ESCALATION_RATIO.observe(len(escalate) / len(decisions))
+            with self._lock:
+                for outcome, _ in decisions:
+                    self.counts[EXITS[outcome]] += 1
+        return decided, escalate
+
+    def stats(self):
+        with self._lock:
+            total = sum(self.counts.values())
+            return {
+                **self.counts,
+                "escalation_rate": round(self.counts["escalated"] / total, 4) if total else 0.0,
+                "dismiss_threshold": self.dismiss,
+                "accept_threshold": self.accept,
+            }
+
+
+def safety_net_guard(judge):
+    """The guard for Cascade: blocks with the RiskDetector's danger words are never dismissed"""
+    return lambda text: judge.needs_safety_net(judge.scan(text))
+
+
+def evaluate(prefilter, texts, labels, dismiss=DISMISS_THRESHOLD, accept=ACCEPT_THRESHOLD,
+             judge=None, reference=None):
+    """
+    How the cascade would route a labeled set: escalation rate, accuracy of
+    the accepted labels, and the real clauses it would dismiss (lost recall).
+
+    With a RiskDetector `judge` it routes like the service (safety-net guard)
+    and checks the clauses its rules flag: how many the cascade dismisses, or
+    accepts with another label than the transformer's (`reference`, the
+    transformer's predictions; the true labels if not given). Either way
+    those rules would not fire in production.
+    """
+    guard = safety_net_guard(judge) if judge is not None else None
+    decisions = Cascade(prefilter, dismiss, accept, guard).decide(texts)
+    accepted = [(p[0], label) for (outcome, p), label in zip(decisions, labels) if outcome == "accept"]
+    report = {
+        "escalation_rate": round(sum(outcome == "escalate" for outcome, _ in decisions) / len(texts), 4) if texts else None,
+        "accept_accuracy": round(sum(a == b for a, b in accepted) / len(accepted), 4) if accepted else None,
+        "dismissed_clauses": sum(outcome == "dismiss" and label != NOISE for (outcome, _), label in zip(decisions, labels)),
+    }
+    if judge is None:
+        return report
+
+    reference = labels if reference is None else reference
+    risky = dismissed = relabeled = 0
+    for text, label, expected, (outcome, prediction) in zip(texts, labels, reference, decisions):
+        if label == NOISE or judge.analyze_risk(label, text)["level"] == "Low Risk":
+            continue
+        risky += 1
+        dismissed += outcome == "dismiss"
+        relabeled += outcome == "accept" and prediction[0] != expected
+    report.update({
+        "risky_clauses": risky,
+        "risky_dismissed": dismissed,
+        "risky_relabeled": relabeled,
+        "risky_recall": round((risky - dismissed - relabeled) / risky, 4) if risky else None,
+    })
+    return report
+
+
+def train_prefilter(splits, classes, output_dir, noise=(), judge=None, reference=None):
+    """
+    Fits the prefilter on the transformer's training split plus the noise
+    blocks (NOISE_EXAMPLES and any NOISE rows of the data) and saves it next
+    to the model; returns its evaluation on the test split (see evaluate for
+    `judge` and `reference`, the transformer's test predictions).
+    """
+    train = splits["train"] + [{"text": text, "label": NOISE} for text in NOISE_EXAMPLES] + list(noise)
+    prefilter = Prefilter.fit([d["text"] for d in train], [d["label"] for d in train], list(classes) + [NOISE])
+    prefilter.save(os.path.join(output_dir, "cascade.npz"))
+    test = splits["test"]
+    if not test:
+        return {}
+    return evaluate(prefilter, [d["text"] for d in test], [d["label"] for d in test],
+                    judge=judge, reference=reference)
+
+
+def load(guard=None):
+    """The cascade, or None when disabled or no prefilter has been trained"""
+    if not ENABLED:
+        return None
+    if not os.path.exists(PREFILTER_PATH):
+        logger.warning("⚠️ No cascade prefilter at %s. Every clause goes to the transformer.", PREFILTER_PATH)
+        logger.warning("👉 Run 'python train_classifier.py' to train it with the classifier.")
+        return None
+    logger.info("🪜 Loading cascade prefilter from: %s", PREFILTER_PATH)
+    return Cascade(Prefilter.load(PREFILTER_PATH), guard=guard)
+
+# --- TEST BLOCK ---
+if __name__ == "__main__":
+    cascade = Cascade(Prefilter.load())
+
+    test_texts = [
+        "Page 2 of 7",
+        "Signature of the Landlord",
+        "The deposit shall be refunded within 15 days of vacating.",
+        "The Landlord may terminate this agreement at will without cause.",
+    ]
+    for text, (outcome, prediction) in zip(test_texts, cascade.decide(test_texts)):
+        print(f"{outcome:9} {prediction!s:40} {text}")
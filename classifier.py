@@ -1,62 +1,244 @@
-from transformers import AutoTokenizer, AutoModelForSequenceClassification
+from transformers import AutoConfig, AutoTokenizer, AutoModelForSequenceClassification
 import torch
+import numpy as np
+import hashlib
+import logging
 import os
 
+logger = logging.getLogger(__name__)
+
+# Upper bound on (batch size x padded length) for one forward pass.
+# Keeps peak activation memory flat no matter how many blocks a document has.
+MAX_BATCH_TOKENS = 8192
+MAX_LENGTH = 512
+
+# --- LONG CLAUSES ---
+# truncate : only the first MAX_LENGTH tokens are classified (old behaviour)
+# max/mean : over-length clauses are split into overlapping windows that are
+#            classified together; their logits are pooled by max or mean
+LONG_INPUT = os.environ.get("LEGALLENS_LONG_INPUT", "max")
+LONG_INPUT_MODES = ("truncate", "max", "mean")
+# Tokens shared by consecutive windows, so no sentence is only ever seen cut
+WINDOW_STRIDE = int(os.environ.get("LEGALLENS_WINDOW_STRIDE", 128))
+# Windows per clause at most; longer clauses get evenly spaced windows
+MAX_WINDOWS = int(os.environ.get("LEGALLENS_MAX_WINDOWS", 8))
+
+# --- INFERENCE BACKENDS ---
+# torch     : full precision PyTorch (reference)
+# int8      : PyTorch dynamic int8 quantization of the Linear layers
+# onnx      : ONNX Runtime on the exported graph
+# onnx-int8 : ONNX Runtime on the int8-quantized graph
+BACKENDS = ("torch", "int8", "onnx", "onnx-int8")
+BACKEND = os.environ.get("LEGALLENS_BACKEND", "torch")
+
+# Exported artifacts live next to the weights (see export_model.py)
+ONNX_DIR = "onnx"
+ONNX_FILES = {"onnx": "model.onnx", "onnx-int8": "model.int8.onnx"}
+
+# Models trained before the taxonomy saved no label names in their config
+LEGACY_LABELS = {0: "Termination", 1: "Rent", 2: "Indemnity", 3: "Notice", 4: "Deposit"}
+
 class ClauseClassifier:
-    def __init__(self):
+    def __init__(self, backend=None, long_input=None):
         # We look for the model YOU just trained
         self.model_path = "./saved_models/clause_model"
-        
+
         # Fallback to base model if training didn't happen (prevents crash)
         if not os.path.exists(self.model_path):
-            print("⚠️ Trained model not found. Using base InLegalBERT (Untrained).")
-            print("👉 PLEASE RUN 'python train_classifier.py' FIRST.")
+            logger.warning("⚠️ Trained model not found. Using base InLegalBERT (Untrained).")
+            logger.warning("👉 PLEASE RUN 'python train_classifier.py' FIRST.")
             self.model_name = "law-ai/InLegalBERT"
         else:
-            print("🧠 Loading Fine-Tuned Model from: " + self.model_path)
+            logger.info("🧠 Loading Fine-Tuned Model from: %s", self.model_path)
             self.model_name = self.model_path
 
+        self.backend = backend or BACKEND
+        if self.backend not in BACKENDS:
+            raise ValueError(f"Unknown backend '{self.backend}'. Choose one of {BACKENDS}.")
+
+        self.long_input = long_input or LONG_INPUT
+        if self.long_input not in LONG_INPUT_MODES:
+            raise ValueError(f"Unknown long input mode '{self.long_input}'. Choose one of {LONG_INPUT_MODES}.")
+
         self.tokenizer = AutoTokenizer.from_pretrained(self.model_name)
+        if self.long_input != "truncate" and not self.tokenizer.is_fast:
+            logger.warning("⚠️ Sliding windows need a fast tokenizer. Long clauses will be truncated.")
+            self.long_input = "truncate"
+        self.model = None
+        self.session = None
+        self._load_backend()
+
+        # Backends (and window pooling) differ slightly in their probabilities,
+        # so they are part of the version
+        self.model_version = f"{self._fingerprint()}-{self.backend}-{self.long_input}"
+
+        # train_classifier.py saves the taxonomy's label map into the config
+        self.id2label = self._load_labels()
+
+    def _load_backend(self):
+        if self.backend in ONNX_FILES:
+            onnx_path = os.path.join(self.model_name, ONNX_DIR, ONNX_FILES[self.backend])
+            try:
+                import onnxruntime
+            except ImportError:
+                onnxruntime = None
+
+            if onnxruntime is not None and os.path.exists(onnx_path):
+                logger.info("⚡ Using ONNX Runtime backend: %s", onnx_path)
+                self.session = onnxruntime.InferenceSession(onnx_path, providers=["CPUExecutionProvider"])
+                self.onnx_inputs = [i.name for i in self.session.get_inputs()]
+                return
+
+            logger.warning("⚠️ ONNX backend unavailable (%s). Falling back to PyTorch.", onnx_path)
+            logger.warning("👉 Run 'python export_model.py' and install onnxruntime to enable it.")
+            self.backend = "torch"
+
         self.model = AutoModelForSequenceClassification.from_pretrained(self.model_name)
-        
-        # These labels match the IDs from your training script
-        self.id2label = {0: "Termination", 1: "Rent", 2: "Indemnity", 3: "Notice", 4: "Deposit"}
+        self.model.eval()
+
+        if self.backend == "int8":
+            logger.info("⚡ Using PyTorch dynamic int8 quantization.")
+            self.model = torch.quantization.quantize_dynamic(self.model, {torch.nn.Linear}, dtype=torch.qint8)
+
+    def _load_labels(self):
+        config = AutoConfig.from_pretrained(self.model_name)
+        id2label = {int(i): label for i, label in config.id2label.items()}
+        if all(label == f"LABEL_{i}" for i, label in id2label.items()):
+            return LEGACY_LABELS
+        return id2label
+
+    def _fingerprint(self):
+        """
+        Identifies the exact weights being served, so caches keyed on it are
+        invalidated by a retrain. Uses file names, sizes and mtimes only.
+        """
+        if not os.path.isdir(self.model_name):
+            return self.model_name
+
+        hasher = hashlib.sha256()
+        for name in sorted(os.listdir(self.model_name)):
+            stat = os.stat(os.path.join(self.model_name, name))
+            hasher.update(f"{name}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+        return hasher.hexdigest()[:16]
 
     def classify_block(self, text):
         """
         Uses the Neural Network to predict the class.
         No if-statements, just pure probability.
         """
-        # 1. Convert text to numbers
-        inputs = self.tokenizer(text, return_tensors="pt", truncation=True, padding=True, max_length=512)
-        
-        # 2. Feed to Model
-        with torch.no_grad():
-            outputs = self.model(**inputs)
-        
-        # 3. Get Probabilities (Softmax)
-        probs = torch.nn.functional.softmax(outputs.logits, dim=-1)
-        
-        # 4. Find the winner
-        confidence, predicted_id = torch.max(probs, dim=1)
-        
-        predicted_label = self.id2label.get(predicted_id.item(), "General")
-        confidence_score = round(confidence.item() * 100, 2)
-
-        return predicted_label, confidence_score
+        return self.classify_batch([text])[0]
+
+    def classify_batch(self, texts, max_batch_tokens=MAX_BATCH_TOKENS):
+        """
+        Classifies many blocks with a handful of forward passes.
+        Returns (label, confidence, window) tuples in the original order.
+        `window` is the (start, end) character span of the window that
+        decided a long clause's label, or None when the clause fit whole.
+        """
+        if not texts:
+            return []
+
+        probs, windows = self._predict(texts, max_batch_tokens)
+        predicted_ids = probs.argmax(axis=1)
+
+        return [
+            (self.id2label.get(int(pred), "General"), round(float(row[pred]) * 100, 2), window)
+            for row, pred, window in zip(probs, predicted_ids, windows)
+        ]
+
+    def predict_proba(self, texts, max_batch_tokens=MAX_BATCH_TOKENS):
+        """Class probabilities as an (n_texts x n_labels) array, in input order."""
+        return self._predict(texts, max_batch_tokens)[0]
+
+    def _predict(self, texts, max_batch_tokens):
+        """
+        Inputs are sorted by token length and packed into dynamically padded
+        batches, so short blocks are never padded up to the longest one.
+        Over-length clauses become overlapping windows that ride in the same
+        batches; their logits are pooled back into one row per clause.
+        Returns (probabilities, deciding window span or None per text).
+        """
+        # 1. Tokenize once, without padding, just to learn the lengths
+        windowed = self.long_input != "truncate"
+        encodings = self.tokenizer(
+            list(texts), truncation=True, max_length=MAX_LENGTH,
+            return_overflowing_tokens=windowed, stride=WINDOW_STRIDE if windowed else 0,
+            return_offsets_mapping=windowed
+        )
+        owners = encodings["overflow_to_sample_mapping"] if windowed else list(range(len(texts)))
+        keys = [key for key in encodings.keys() if key not in ("overflow_to_sample_mapping", "offset_mapping")]
+
+        # 2. Bound the windows per clause (evenly spaced, first and last kept)
+        windows = [[] for _ in texts]
+        for row, owner in enumerate(owners):
+            windows[owner].append(row)
+        for i, rows in enumerate(windows):
+            if len(rows) > MAX_WINDOWS:
+                windows[i] = [rows[j] for j in np.unique(np.linspace(0, len(rows) - 1, MAX_WINDOWS).round().astype(int))]
+
+        selected = [row for rows in windows for row in rows]
+        lengths = {row: len(encodings["input_ids"][row]) for row in selected}
+        order = sorted(selected, key=lambda row: lengths[row])
+
+        # 3. Pack shortest-first; the newest member is always the longest,
+        # so the padded cost of a batch is simply len(batch) * lengths[i]
+        logits = {}
+        batch = []
+        for row in order:
+            if batch and lengths[row] * (len(batch) + 1) > max_batch_tokens:
+                self._run_batch(batch, encodings, keys, logits)
+                batch = []
+            batch.append(row)
+        if batch:
+            self._run_batch(batch, encodings, keys, logits)
+
+        # 4. One row per clause
+        probs, spans = [], []
+        for rows in windows:
+            stacked = np.stack([logits[row] for row in rows])
+            pooled = stacked.max(axis=0) if self.long_input == "max" else stacked.mean(axis=0)
+            exp = np.exp(pooled - pooled.max())
+            probs.append(exp / exp.sum())
+
+            if len(rows) == 1:
+                spans.append(None)
+            else:
+                # The window most in favour of the winning label
+                decider = rows[int(stacked[:, pooled.argmax()].argmax())]
+                offsets = [span for span in encodings["offset_mapping"][decider] if span[1] > 0]
+                spans.append((int(offsets[0][0]), int(offsets[-1][1])))
+
+        return np.stack(probs), spans
+
+    def _run_batch(self, indices, encodings, keys, logits):
+        """Pads one batch to its own longest member and stores its logits."""
+        features = [{key: encodings[key][i] for key in keys} for i in indices]
+        inputs = self.tokenizer.pad(features, return_tensors="pt")
+
+        for i, row in zip(indices, self._forward(inputs).numpy()):
+            logits[i] = row
+
+    def _forward(self, inputs):
+        """Logits for one padded batch on the active backend"""
+        if self.session is not None:
+            feeds = {name: inputs[name].numpy().astype(np.int64) for name in self.onnx_inputs}
+            return torch.from_numpy(self.session.run(None, feeds)[0])
+
+        with torch.inference_mode():
+            return self.model(**inputs).logits.float()
 
 # --- TEST BLOCK ---
 if __name__ == "__main__":
     classifier = ClauseClassifier()
-    
+
     # New text the model has NEVER seen (to test generalization)
     test_text = "The lessee is obligated to remit payment by the first week of every month."
-    
-    label, conf = classifier.classify_block(test_text)
+
+    label, conf, _ = classifier.classify_block(test_text)
     print(f"\nText: {test_text}")
     print(f"Prediction: {label} (Confidence: {conf}%)")
-    
+
     test_text_2 = "This contract can be voided if the tenant destroys property."
-    label, conf = classifier.classify_block(test_text_2)
+    label, conf, _ = classifier.classify_block(test_text_2)
     print(f"\nText: {test_text_2}")
-    print(f"Prediction: {label} (Confidence: {conf}%)") 
\ No newline at end of file
+    print(f"Prediction: {label} (Confidence: {conf}%)")
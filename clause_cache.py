@@ -0,0 +1,176 @@
+import difflib
+import hashlib
+import os
+import re
+import unicodedata
+
+import cache
+import segmenter
+
+# --- CONFIGURATION ---
+CLAUSE_MEMORY_ITEMS = int(os.environ.get("LEGALLENS_CLAUSE_CACHE_ITEMS", 20000))
+CLAUSE_DISK_MAX_BYTES = int(os.environ.get("LEGALLENS_CLAUSE_CACHE_DISK_MB", 256)) * 1024 * 1024
+# Characters of each clause kept in a document's manifest (to show removed clauses)
+PREVIEW_CHARS = 120
+# A replaced clause this similar to the old one (difflib ratio) is "modified"
+MODIFIED_SIMILARITY = 0.5
+
+# Typographic variants that differ between versions of the same text
+_TRANSLATE = str.maketrans({"‘": "'", "’": "'", "“": '"', "”": '"', "–": "-", "—": "-"})
+_SPACES = re.compile(r"\s+")
+
+
+def normalize(text):
+    """
+    The part of a clause that decides its verdict: case, whitespace, quote
+    and dash styles and the clause number are ignored, so a renumbered or
+    re-typeset clause still counts as unchanged.
+    """
+    text = unicodedata.normalize("NFKC", text).translate(_TRANSLATE)
+    text = _SPACES.sub(" ", text).strip()
+    text = segmenter.CLAUSE_START.sub("", text, count=1).strip()
+    return text.lower()
+
+
+def clause_hash(text):
+    return hashlib.sha256(normalize(text).encode()).hexdigest()[:32]
+
+
+class ClauseCache:
+    """
+    Clause-level memo of the expensive model outputs (classifier label and
+    confidence, semantic matches; not the text-specific window span), keyed by normalized-text hash plus the
+    model versions. Shared by every document, so boilerplate is classified
+    once; bounded and LRU-evicted in memory and on disk like the result cache.
+
+    It also keeps each analyzed document's manifest (its clause hashes in
+    order) so a new version can be compared with the previous one.
+    """
+
+    def __init__(self, versions, tiers=None):
+        self.versions = tuple(str(v) for v in versions)
+        if tiers is None:
+            os.makedirs(cache.CACHE_DIR, exist_ok=True)
+            tiers = [
+                cache.MemoryLRU(CLAUSE_MEMORY_ITEMS),
+                cache.SQLiteStore(os.path.join(cache.CACHE_DIR, "clauses.sqlite3"), CLAUSE_DISK_MAX_BYTES),
+            ]
+        self.store = cache.ResultCache(tiers)
+
+    def _key(self, digest):
+        return cache.make_key(digest, *self.versions)
+
+    def lookup(self, texts):
+        """
+        Returns (entries, missing): entries[i] is {"prediction", "matches"}
+        for cached clauses and None otherwise; `missing` lists those indices.
+        """
+        keys = [self._key(clause_hash(text)) for text in texts]
+        found = self.store.get_many(keys)
+        entries = [found.get(key) for key in keys]
+        return entries, [i for i, entry in enumerate(entries) if entry is None]
+
+    def fill(self, texts, entries, missing, predictions, matches=None):
+        """
+        Puts the freshly computed results for `missing` into `entries` and
+        the cache; returns the full (predictions, matches) lists.
+        """
+        new = {}
+        fresh = {}
+        for n, i in enumerate(missing):
+            # Only (label, confidence): a window span indexes this exact text,
+            # and a hit may come from a renumbered or re-spaced variant of it
+            entries[i] = {
+                "prediction": list(predictions[n][:2]),
+                "matches": matches[n] if matches is not None else None,
+            }
+            new[self._key(clause_hash(texts[i]))] = entries[i]
+            fresh[i] = tuple(predictions[n])
+        self.store.put_many(new)
+
+        # Cached clauses come back without a window
+        all_predictions = [fresh.get(i) or (*entry["prediction"][:2], None) for i, entry in enumerate(entries)]
+        all_matches = [entry["matches"] for entry in entries]
+        return all_predictions, (all_matches if any(m is not None for m in all_matches) else None)
+
+    def classify(self, texts, classifier, matcher=None):
+        """Blocking lookup -> compute the misses -> fill, for scripts and workers"""
+        entries, missing = self.lookup(texts)
+        todo = [texts[i] for i in missing]
+        # The matcher encodes on its own thread while the classifier runs
+        matched = matcher.submit(todo) if matcher is not None and todo else None
+        predictions = classifier.classify_batch(todo) if todo else []
+        matches = matched.result() if matched is not None else None
+        return self.fill(texts, entries, missing, predictions, matches)
+
+    # --- DOCUMENT MANIFESTS ---
+
+    def save_manifest(self, fingerprint, text_blocks, analyzed_risks):
+        """Records a document's clauses (hash, page, preview, risk level) in order"""
+        return self.put_manifest(fingerprint, build_manifest(text_blocks, analyzed_risks))
+
+    def put_manifest(self, fingerprint, manifest):
+        """Stores an already built manifest (e.g. a job's, assembled page by page)"""
+        # Model independent: versions can be compared across a retrain
+        self.store.put(cache.make_key("manifest", fingerprint), {"clauses": manifest})
+        return manifest
+
+    def load_manifest(self, fingerprint):
+        value = self.store.get(cache.make_key("manifest", fingerprint))
+        return value["clauses"] if value is not None else None
+
+
+def build_manifest(text_blocks, analyzed_risks):
+    """A document's (or one page's) clause entries; risk ids index `text_blocks`"""
+    levels = {risk["id"] - 1: risk["type"] for risk in analyzed_risks}
+    return [
+        {
+            "hash": clause_hash(block["text"]),
+            "page": block["page"] + 1,
+            "preview": block["text"][:PREVIEW_CHARS],
+            "risk": levels.get(idx),
+        }
+        for idx, block in enumerate(text_blocks)
+    ]
+
+
+def diff(previous, current):
+    """
+    What changed between two manifests, aligned on clause hashes:
+    unchanged count, plus the added, modified and removed clauses.
+    Ids of added/modified clauses are those used in the new response.
+    """
+    matcher = difflib.SequenceMatcher(
+        a=[c["hash"] for c in previous], b=[c["hash"] for c in current], autojunk=False
+    )
+    changes = {"unchanged": 0, "added": [], "modified": [], "removed": []}
+
+    for tag, a0, a1, b0, b1 in matcher.get_opcodes():
+        if tag == "equal":
+            changes["unchanged"] += a1 - a0
+            continue
+
+        old, new = previous[a0:a1], current[b0:b1]
+        # A replaced run pairs up clause by clause where the texts are still
+        # alike (an edit); everything else was added or removed
+        paired = set()
+        if tag == "replace":
+            for n in range(min(len(old), len(new))):
+                similarity = difflib.SequenceMatcher(a=old[n]["preview"], b=new[n]["preview"]).ratio()
+                if similarity >= MODIFIED_SIMILARITY:
+                    paired.add(n)
+                    changes["modified"].append({
+                        "id": b0 + n + 1,
+                        "page": new[n]["page"],
+                        "previous_risk": old[n]["risk"],
+                        "risk": new[n]["risk"],
+                    })
+
+        for n, clause in enumerate(new):
+            if n not in paired:
+                changes["added"].append({"id": b0 + n + 1, "page": clause["page"], "risk": clause["risk"]})
+        for n, clause in enumerate(old):
+            if n not in paired:
+                changes["removed"].append({"page": clause["page"], "preview": clause["preview"], "risk": clause["risk"]})
+
+    return changes
@@ -0,0 +1,95 @@
+import argparse
+import os
+
+import numpy as np
+import torch
+from transformers import AutoTokenizer, AutoModelForSequenceClassification
+
+from classifier import BACKENDS, ONNX_DIR, ONNX_FILES, ClauseClassifier
+from train_classifier import OUTPUT_DIR, train_data
+
+# --- CONFIGURATION ---
+OPSET_VERSION = 14
+# Positional order of BertForSequenceClassification.forward
+INPUT_ORDER = ("input_ids", "attention_mask", "token_type_ids")
+
+
+def export_onnx(model_dir=OUTPUT_DIR):
+    """
+    Step 1: Export the fine-tuned model to ONNX (dynamic batch + sequence axes),
+    then write an int8 dynamically-quantized copy next to it.
+    """
+    print(f"📦 Exporting {model_dir} to ONNX...")
+    tokenizer = AutoTokenizer.from_pretrained(model_dir)
+    model = AutoModelForSequenceClassification.from_pretrained(model_dir)
+    model.eval()
+
+    dummy = tokenizer(["The tenant shall pay rent monthly."], return_tensors="pt")
+    input_names = [name for name in INPUT_ORDER if name in dummy]
+
+    out_dir = os.path.join(model_dir, ONNX_DIR)
+    os.makedirs(out_dir, exist_ok=True)
+    onnx_path = os.path.join(out_dir, ONNX_FILES["onnx"])
+
+    torch.onnx.export(
+        model,
+        tuple(dummy[name] for name in input_names),
+        onnx_path,
+        input_names=input_names,
+        output_names=["logits"],
+        dynamic_axes={**{name: {0: "batch", 1: "sequence"} for name in input_names}, "logits": {0: "batch"}},
+        opset_version=OPSET_VERSION,
+    )
+    print(f"✅ Saved {onnx_path}")
+
+    # 2. int8 weights for the ONNX graph
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    int8_path = os.path.join(out_dir, ONNX_FILES["onnx-int8"])
+    quantize_dynamic(onnx_path, int8_path, weight_type=QuantType.QInt8)
+    print(f"✅ Saved {int8_path}")
+
+
+def check_parity(backends=BACKENDS):
+    """
+    Step 2: Compare every backend against the fp32 PyTorch model on the
+    training examples. Reports label agreement and max probability drift.
+    """
+    texts = [text for text, _ in train_data]
+    reference = ClauseClassifier(backend="torch").predict_proba(texts)
+    reference_labels = reference.argmax(axis=1)
+
+    report = {}
+    for backend in backends:
+        if backend == "torch":
+            continue
+
+        candidate = ClauseClassifier(backend=backend)
+        if candidate.backend != backend:
+            print(f"⚠️ Skipping {backend}: not available.")
+            continue
+
+        probs = candidate.predict_proba(texts)
+        report[backend] = {
+            "label_agreement": round(float((probs.argmax(axis=1) == reference_labels).mean()), 4),
+            "max_prob_drift": round(float(np.abs(probs - reference).max()), 6),
+            "examples": len(texts),
+        }
+
+    print("\n--- 🔬 BACKEND PARITY vs fp32 ---")
+    for backend, result in report.items():
+        print(f"{backend:>10}: agreement {result['label_agreement'] * 100:.2f}% | "
+              f"max prob drift {result['max_prob_drift']:.6f} ({result['examples']} examples)")
+
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export ONNX/int8 artifacts and check backend parity.")
+    parser.add_argument("--skip-export", action="store_true", help="Only run the parity check")
+    parser.add_argument("--backends", nargs="+", default=list(BACKENDS), choices=BACKENDS)
+    args = parser.parse_args()
+
+    if not args.skip_export:
+        export_onnx()
+    check_parity(args.backends)
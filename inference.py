@@ -0,0 +1,232 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import metrics
+from pipeline import Overloaded
+
+# --- CONFIGURATION ---
+# Texts per forward pass; a batch is flushed as soon as it is this full
+MAX_BATCH_SIZE = int(os.environ.get("LEGALLENS_MAX_BATCH_SIZE", 64))
+# ...or this long after its first text arrived, whichever comes first
+MAX_BATCH_WAIT_MS = float(os.environ.get("LEGALLENS_MAX_BATCH_WAIT_MS", 10))
+# Chunks waiting for the model before new uploads get a 503
+INFERENCE_QUEUE_DEPTH = int(os.environ.get("LEGALLENS_INFERENCE_QUEUE_DEPTH", 256))
+
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, float("inf"))
+
+
+def _gather(futures):
+    """Combines chunk futures into one future of the concatenated results"""
+    combined = Future()
+    results = [None] * len(futures)
+    remaining = [len(futures)]
+    lock = threading.Lock()
+
+    def on_done(index, future):
+        if combined.done():
+            return
+        if future.cancelled() or future.exception() is not None:
+            error = Overloaded("Inference cancelled") if future.cancelled() else future.exception()
+            with lock:
+                if not combined.done():
+                    combined.set_exception(error)
+            return
+        with lock:
+            results[index] = future.result()
+            remaining[0] -= 1
+            if remaining[0] == 0:
+                combined.set_result([r for chunk in results for r in chunk])
+
+    for index, future in enumerate(futures):
+        future.add_done_callback(lambda f, i=index: on_done(i, f))
+    return combined
+
+
+def _merge(decided, escalate, future):
+    """Puts the transformer's predictions for `escalate` back among the cascade's early exits"""
+    combined = Future()
+
+    def on_done(future):
+        if future.cancelled() or future.exception() is not None:
+            combined.set_exception(Overloaded("Inference cancelled") if future.cancelled() else future.exception())
+            return
+        predictions = {**decided, **dict(zip(escalate, future.result()))}
+        combined.set_result([predictions[i] for i in range(len(predictions))])
+
+    future.add_done_callback(on_done)
+    return combined
+
+
+class InferenceScheduler:
+    """
+    Dynamic micro-batching in front of the shared ClauseClassifier.
+
+    Every in-flight document submits its blocks here. One background thread
+    owns the model and keeps pulling chunks from all documents into a single
+    batch until it holds `max_batch_size` texts or `max_wait_ms` has passed,
+    then runs one classify_batch call and resolves each caller's future.
+
+    With a cascade.Cascade, texts are routed on the caller's thread first and
+    only the escalated ones are queued, so early exits never take batch slots.
+    """
+
+    def __init__(self, classifier, max_batch_size=MAX_BATCH_SIZE,
+                 max_wait_ms=MAX_BATCH_WAIT_MS, max_queue=INFERENCE_QUEUE_DEPTH, cascade=None):
+        self.classifier = classifier
+        self.cascade = cascade
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = queue.Queue(maxsize=max_queue)
+        # A chunk that did not fit into the previous batch opens the next one
+        self._carry = None
+
+        # Metrics
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.texts = 0
+        self.size_histogram = {bucket: 0 for bucket in BATCH_SIZE_BUCKETS}
+
+        self._thread = threading.Thread(target=self._run, name="inference", daemon=True)
+        self._thread.start()
+
+    def submit(self, texts):
+        """
+        Queues a list of texts; returns a Future of [(label, confidence, window), ...]
+        in the same order. Raises Overloaded if the queue is full.
+        """
+        texts = list(texts)
+        return self._submit_routed(texts, *self._route(texts))
+
+    def _route(self, texts):
+        """(decided, escalate) as in Cascade.route; everything escalates without a cascade"""
+        if self.cascade is not None and texts:
+            return self.cascade.route(texts)
+        return {}, list(range(len(texts)))
+
+    def _submit_routed(self, texts, decided, escalate):
+        if not decided:
+            return self._submit(texts)
+        return _merge(decided, escalate, self._submit([texts[i] for i in escalate]))
+
+    def _submit(self, texts):
+        if not texts:
+            future = Future()
+            future.set_result([])
+            return future
+
+        chunks = []
+        try:
+            for start in range(0, len(texts), self.max_batch_size):
+                future = Future()
+                self._queue.put_nowait((texts[start:start + self.max_batch_size], future))
+                chunks.append(future)
+        except queue.Full:
+            # Don't leave half a document in the queue
+            for future in chunks:
+                future.cancel()
+            raise Overloaded("Inference queue is full")
+
+        return chunks[0] if len(chunks) == 1 else _gather(chunks)
+
+    def classify_batch(self, texts):
+        """
+        Blocking drop-in for ClauseClassifier.classify_batch, for background
+        callers (jobs, batch runs): waits for queue room instead of raising.
+        Texts are queued one batch-sized chunk at a time, so a document of
+        any size is admitted eventually, even one bigger than the whole queue.
+        """
+        # Routed once: a retry only re-queues an escalated chunk
+        texts = list(texts)
+        decided, escalate = self._route(texts)
+        escalated = [texts[i] for i in escalate]
+
+        futures = []
+        for start in range(0, len(escalated), self.max_batch_size):
+            chunk = escalated[start:start + self.max_batch_size]
+            while True:
+                try:
+                    futures.append(self._submit(chunk))
+                    break
+                except Overloaded:
+                    time.sleep(self.max_wait)
+
+        predictions = {**decided, **dict(zip(escalate, (p for f in futures for p in f.result())))}
+        return [predictions[i] for i in range(len(texts))]
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def stats(self):
+        with self._lock:
+            stats = {
+                "batches": self.batches,
+                "texts": self.texts,
+                "mean_batch_size": round(self.texts / self.batches, 2) if self.batches else 0.0,
+                "batch_fill_ratio": round(self.texts / (self.batches * self.max_batch_size), 4) if self.batches else 0.0,
+                "batch_size_histogram": {f"le_{b}": n for b, n in self.size_histogram.items()},
+                "queue_depth": self.pending(),
+            }
+        if self.cascade is not None:
+            stats["cascade"] = self.cascade.stats()
+        return stats
+
+    def _collect(self):
+        """Blocks for the first chunk, then fills the batch until size or deadline"""
+        if self._carry is not None:
+            batch, self._carry = [self._carry], None
+        else:
+            batch = [self._queue.get()]
+        size = len(batch[0][0])
+        deadline = time.monotonic() + self.max_wait
+
+        while size < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if size + len(item[0]) > self.max_batch_size:
+                self._carry = item
+                break
+            batch.append(item)
+            size += len(item[0])
+
+        return batch
+
+    def _record(self, size):
+        metrics.MODEL_BATCH_SIZE.observe(size)
+        with self._lock:
+            self.batches += 1
+            self.texts += size
+            for bucket in BATCH_SIZE_BUCKETS:
+                if size <= bucket:
+                    self.size_histogram[bucket] += 1
+                    break
+
+    def _run(self):
+        while True:
+            batch = [(texts, future) for texts, future in self._collect()
+                     if future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+
+            all_texts = [text for texts, _ in batch for text in texts]
+            self._record(len(all_texts))
+
+            try:
+                predictions = self.classifier.classify_batch(all_texts)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            # Hand each caller back its own slice
+            start = 0
+            for texts, future in batch:
+                future.set_result(predictions[start:start + len(texts)])
+                start += len(texts)
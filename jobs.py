@@ -0,0 +1,401 @@
+import json
+import logging
+import os
+import shutil
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import cache
+import clause_cache
+import metrics
+import ocr_engine
+import pipeline
+import segmenter
+
+logger = logging.getLogger(__name__)
+
+# --- CONFIGURATION ---
+JOBS_DIR = os.environ.get("LEGALLENS_JOBS_DIR", os.path.join(cache.CACHE_DIR, "jobs"))
+# Documents processed at once per worker process (their pages share the OCR pool)
+JOB_WORKERS = int(os.environ.get("LEGALLENS_JOB_WORKERS", 2))
+# Jobs exist for big documents, so they get a larger upload cap than /analyze
+JOB_MAX_UPLOAD_BYTES = int(os.environ.get("LEGALLENS_JOB_MAX_UPLOAD_MB", 500)) * 1024 * 1024
+# A running job whose worker has not reported a page for this long is taken over
+STALE_SECONDS = int(os.environ.get("LEGALLENS_JOB_STALE_SECONDS", 300))
+POLL_SECONDS = 1.0
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+FINISHED = (DONE, FAILED)
+
+
+class JobLost(Exception):
+    """Raised when another worker has taken over a job this one was running"""
+
+
+class JobStore:
+    """
+    Jobs and their per-page results in SQLite. Shared by every worker
+    process on the node, so a job outlives the process that accepted it.
+    """
+
+    def __init__(self, path=None):
+        if path is None:
+            os.makedirs(JOBS_DIR, exist_ok=True)
+            path = os.path.join(JOBS_DIR, "jobs.sqlite3")
+
+        self._lock = threading.Lock()
+        # Opened on first use in each process, never inherited across fork()
+        self._connection = cache.LazyConnection(path, self._setup, sqlite3.Row)
+
+    @property
+    def _db(self):
+        return self._connection()
+
+    @staticmethod
+    def _setup(db):
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id TEXT PRIMARY KEY, filename TEXT, input_path TEXT NOT NULL,"
+            " content_hash TEXT NOT NULL, status TEXT NOT NULL,"
+            " pages_total INTEGER, pages_done INTEGER NOT NULL DEFAULT 0,"
+            " result TEXT, error TEXT, owner TEXT, heartbeat REAL,"
+            " created REAL NOT NULL, updated REAL NOT NULL)"
+        )
+        db.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created)")
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS job_pages ("
+            " job_id TEXT NOT NULL, page INTEGER NOT NULL,"
+            " blocks INTEGER NOT NULL, risks TEXT NOT NULL, clauses TEXT,"
+            " PRIMARY KEY (job_id, page))"
+        )
+        columns = {row["name"] for row in db.execute("PRAGMA table_info(job_pages)")}
+        if "clauses" not in columns:
+            # Stores created before pages kept their clause manifest
+            db.execute("ALTER TABLE job_pages ADD COLUMN clauses TEXT")
+
+    def create(self, filename, input_path, content_hash, job_id=None):
+        job_id = job_id or uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO jobs (id, filename, input_path, content_hash, status, created, updated)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (job_id, filename, input_path, content_hash, QUEUED, now, now)
+            )
+            self._db.commit()
+        return job_id
+
+    def get(self, job_id):
+        with self._lock:
+            row = self._db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def pages(self, job_id, start=0):
+        """Finished pages from `start` on, in page order"""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT page, blocks, risks, clauses FROM job_pages WHERE job_id = ? AND page >= ? ORDER BY page",
+                (job_id, start)
+            ).fetchall()
+        return [
+            {"page": row["page"], "blocks": row["blocks"], "risks": json.loads(row["risks"]),
+             "clauses": json.loads(row["clauses"]) if row["clauses"] else []}
+            for row in rows
+        ]
+
+    def claim(self, owner, stale_seconds=STALE_SECONDS):
+        """
+        Atomically hands the oldest queued (or abandoned) job to `owner`.
+        Safe across processes: the UPDATE only succeeds for one claimant.
+        """
+        now = time.time()
+        claimable = "(status = ? OR (status = ? AND heartbeat < ?))"
+        args = (QUEUED, RUNNING, now - stale_seconds)
+
+        with self._lock:
+            row = self._db.execute(
+                f"SELECT id FROM jobs WHERE {claimable} ORDER BY created LIMIT 1", args
+            ).fetchone()
+            if row is None:
+                return None
+            won = self._db.execute(
+                f"UPDATE jobs SET status = ?, owner = ?, heartbeat = ?, updated = ? WHERE id = ? AND {claimable}",
+                (RUNNING, owner, now, now, row["id"]) + args
+            ).rowcount
+            self._db.commit()
+
+        return self.get(row["id"]) if won else None
+
+    def release_orphans(self, is_dead):
+        """Re-queues running jobs whose owner `is_dead(owner)`; returns how many"""
+        with self._lock:
+            rows = self._db.execute("SELECT id, owner FROM jobs WHERE status = ?", (RUNNING,)).fetchall()
+            orphans = [row["id"] for row in rows if is_dead(row["owner"])]
+            for job_id in orphans:
+                self._db.execute(
+                    "UPDATE jobs SET status = ?, owner = NULL, updated = ? WHERE id = ? AND status = ?",
+                    (QUEUED, time.time(), job_id, RUNNING)
+                )
+            self._db.commit()
+        return len(orphans)
+
+    def _update(self, job_id, owner, **fields):
+        fields.update(heartbeat=time.time(), updated=time.time())
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        changed = self._db.execute(
+            f"UPDATE jobs SET {assignments} WHERE id = ? AND owner = ? AND status = ?",
+            tuple(fields.values()) + (job_id, owner, RUNNING)
+        ).rowcount
+        self._db.commit()
+        if not changed:
+            raise JobLost(job_id)
+
+    def set_total(self, job_id, owner, pages_total):
+        with self._lock:
+            self._update(job_id, owner, pages_total=pages_total)
+
+    def add_page(self, job_id, owner, page, blocks, risks, clauses=()):
+        """A finished page: its block count, risks and clause manifest entries"""
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO job_pages (job_id, page, blocks, risks, clauses) VALUES (?, ?, ?, ?, ?)",
+                (job_id, page, blocks, json.dumps(risks), json.dumps(list(clauses)))
+            )
+            done = self._db.execute("SELECT COUNT(*) FROM job_pages WHERE job_id = ?", (job_id,)).fetchone()[0]
+            self._update(job_id, owner, pages_done=done)
+
+    def resume_point(self, job_id):
+        """(first page still to do, blocks before it); pages finish in order"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(blocks), 0) FROM job_pages WHERE job_id = ?", (job_id,)
+            ).fetchone()
+        return row[0], row[1]
+
+    def finish(self, job_id, owner, result):
+        with self._lock:
+            self._update(job_id, owner, status=DONE, result=json.dumps(result))
+
+    def fail(self, job_id, owner, error):
+        with self._lock:
+            self._update(job_id, owner, status=FAILED, error=error)
+
+
+def _owner_id():
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+def _pid_exists(pid):
+    """
+    Whether a local process is alive. Not os.kill(pid, 0) on Windows: there
+    signal 0 is CTRL_C_EVENT and would interrupt the process instead.
+    """
+    if os.name == "nt":
+        import ctypes
+
+        kernel32 = ctypes.WinDLL("kernel32", use_last_error=True)
+        handle = kernel32.OpenProcess(0x1000, False, pid)   # PROCESS_QUERY_LIMITED_INFORMATION
+        if not handle:
+            # ERROR_ACCESS_DENIED: it exists, it just isn't ours
+            return ctypes.get_last_error() == 5
+        try:
+            code = ctypes.c_ulong()
+            if not kernel32.GetExitCodeProcess(handle, ctypes.byref(code)):
+                return True
+            return code.value == 259   # STILL_ACTIVE
+        finally:
+            kernel32.CloseHandle(handle)
+
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _is_dead_local(owner):
+    """True for owners that ran in a process on this host that no longer exists"""
+    try:
+        host, pid, _ = (owner or "").split(":")
+        if host != socket.gethostname():
+            return False
+        return not _pid_exists(int(pid))
+    except (ValueError, OSError):
+        return False
+
+
+class JobRunner:
+    """
+    Background document processing for the /jobs API.
+
+    A dispatcher thread claims jobs from the store while this process has
+    free slots and the models are ready. Each job is OCR'd page by page;
+    every page's risks are written to the store as soon as the page is
+    done, so clients see partial results and a restarted worker resumes
+    after the last finished page.
+    """
+
+    def __init__(self, store, service, result_cache=None, workers=JOB_WORKERS):
+        self.store = store
+        self.service = service
+        self.result_cache = result_cache
+        self.workers = workers
+        self.owner = None
+        self._pool = None
+        self._slots = threading.Semaphore(workers)
+        self._wake = threading.Event()
+        self._pid = None
+
+    def start(self):
+        """Starts this process's dispatcher (idempotent; call post-fork)"""
+        if self._pid == os.getpid():
+            return self
+        self._pid = os.getpid()
+        self.owner = _owner_id()
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="job")
+
+        released = self.store.release_orphans(_is_dead_local)
+        if released:
+            logger.info("♻️  Re-queued %d job(s) left by a stopped worker.", released)
+
+        threading.Thread(target=self._dispatch, name="job-dispatcher", daemon=True).start()
+        return self
+
+    def submit(self, document):
+        """Persists an uploads.Document next to the store and queues it"""
+        job_id = uuid.uuid4().hex
+        os.makedirs(JOBS_DIR, exist_ok=True)
+        suffix = ".pdf" if ocr_engine.is_pdf(document.source) else os.path.splitext(document.filename or "")[1]
+        input_path = os.path.join(JOBS_DIR, job_id + suffix)
+
+        if document.data is not None:
+            with open(input_path, "wb") as f:
+                f.write(document.data)
+        else:
+            shutil.copyfile(document.path, input_path)
+
+        self.store.create(document.filename, input_path, document.content_hash, job_id)
+        self._wake.set()
+        return job_id
+
+    def _dispatch(self):
+        while True:
+            self._wake.wait(POLL_SECONDS)
+            self._wake.clear()
+            if not self.service.ready:
+                continue
+
+            while self._slots.acquire(blocking=False):
+                try:
+                    job = self.store.claim(self.owner)
+                except Exception as e:
+                    logger.exception("❌ Job store error: %s", e)
+                    job = None
+                if job is None:
+                    self._slots.release()
+                    break
+                self._pool.submit(self._run, job)
+
+    def _run(self, job):
+        try:
+            self._process(job)
+        except JobLost:
+            logger.warning("⚠️ Job %s was taken over by another worker.", job["id"])
+        except Exception as e:
+            logger.exception("❌ Job %s failed: %s", job["id"], e)
+            try:
+                self.store.fail(job["id"], self.owner, str(e))
+            except JobLost:
+                # Another worker owns it now, and still needs the input
+                return
+            # Terminal: nothing will read the input again
+            _discard_input(job["input_path"])
+        finally:
+            self._slots.release()
+            self._wake.set()
+
+    def _process(self, job):
+        job_id, source = job["id"], job["input_path"]
+        judge, matcher = self.service.judge, self.service.matcher
+        timer = metrics.RequestTimings()
+
+        self.store.set_total(job_id, self.owner, pipeline.count_document_pages(source))
+        start, block_offset = self.store.resume_point(job_id)
+        logger.info("📄 Job %s: %s (from page %d)", job_id, job["filename"], start + 1)
+
+        for page_index, words in pipeline.iter_document_pages(source, timer, start):
+            with timer.span("segment"):
+                text_blocks = segmenter.segment_clauses(words)
+
+            candidates = pipeline.select_candidates(text_blocks)
+            texts = [text for _, text in candidates]
+            with timer.span("classify"):
+                predictions, matches = pipeline.classify_clauses(
+                    texts, self.service.inference, matcher, self.service.clauses
+                )
+            with timer.span("risk"):
+                page_risks = pipeline.assess_risks(judge, text_blocks, candidates, predictions, matches)
+            # Before the ids are shifted: they index this page's blocks
+            page_clauses = clause_cache.build_manifest(text_blocks, page_risks)
+
+            # Block ids count from the start of the document, as in /analyze
+            for risk in page_risks:
+                risk["id"] += block_offset
+            block_offset += len(text_blocks)
+
+            self.store.add_page(job_id, self.owner, page_index, len(text_blocks), page_risks, page_clauses)
+
+        pages = self.store.pages(job_id)
+        analyzed_risks = [risk for page in pages for risk in page["risks"]]
+        result = pipeline.build_result(job["filename"], block_offset, analyzed_risks)
+        # Same fingerprint + manifest as /analyze, so a job can be a ?previous= version
+        manifest = [clause for page in pages for clause in page["clauses"]]
+        pipeline.finish_result(result, job["content_hash"], self.service.clauses, manifest)
+        self.store.finish(job_id, self.owner, result)
+        logger.info("✅ Job %s done: %d risks.", job_id, len(analyzed_risks))
+
+        if self.result_cache is not None:
+            key = cache.make_key(job["content_hash"], *self.service.versions())
+            self.result_cache.put(key, result)
+        _discard_input(source)
+
+
+def _discard_input(path):
+    """Deletes a finished or failed job's input file (it may already be gone)"""
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def describe(job, pages=None):
+    """The public view of a job: progress plus every risk found so far (if `pages` given)"""
+    body = {
+        "id": job["id"],
+        "filename": job["filename"],
+        "status": job["status"],
+        "pages_done": job["pages_done"],
+        "pages_total": job["pages_total"],
+    }
+    if pages is not None:
+        body["risks"] = [risk for page in pages for risk in page["risks"]]
+    if job["status"] == DONE:
+        body["summary"] = job["result"]["summary"]
+    if job["status"] == FAILED:
+        body["error"] = job["error"]
+    return body
+
+
+def format_event(event, data):
+    """One Server-Sent Events message"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
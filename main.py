@@ -1,16 +1,37 @@
-import torch
-
-from fastapi import FastAPI, UploadFile, File
+from fastapi import FastAPI, UploadFile, File, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-import shutil
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.concurrency import iterate_in_threadpool
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+import asyncio
+import logging
 import os
-import uuid
 
+import batch
+import cache
+import clause_cache
+import jobs
+import metrics
+import pipeline
 import preprocess
-import ocr_engine
-from classifier import ClauseClassifier
-from risk_detector import RiskDetector
+import segmenter
+import uploads
+from models import models
 import re
+
+# --- CONFIGURATION ---
+# Uploads being processed at once; the next one gets a 503
+MAX_CONCURRENT_REQUESTS = int(os.environ.get("LEGALLENS_MAX_CONCURRENT_REQUESTS", 8))
+# Threads for file I/O and for driving the OCR process pool
+IO_WORKERS = int(os.environ.get("LEGALLENS_IO_WORKERS", 8))
+RETRY_AFTER_SECONDS = 5
+# How often a /jobs/{id}/events stream checks the job store for new pages
+EVENT_POLL_SECONDS = 0.5
+
+metrics.setup_logging()
+logger = logging.getLogger("legallens")
+
 app = FastAPI()
 
 # 1. Enable CORS
@@ -21,100 +42,334 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# 2. Load Models
-print("⏳ Loading AI Models... Please wait.")
-classifier = ClauseClassifier()
-judge = RiskDetector()
-print("✅ LegalLens AI Service is Ready!")
+# 2. Models load in the background (see models.py); /ready reports when done
+result_cache = cache.ResultCache()
+
+# Large documents go through the job queue (see jobs.py) instead of /analyze
+job_store = jobs.JobStore()
+job_runner = jobs.JobRunner(job_store, models, result_cache)
+
+@app.on_event("startup")
+def load_models():
+    models.start_in_background()
+    job_runner.start()
+
+# 3. Executors
+io_pool = ThreadPoolExecutor(max_workers=IO_WORKERS, thread_name_prefix="io")
+admission = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+
+def overloaded_response(reason):
+    return JSONResponse(
+        status_code=503,
+        content={"error": f"Server busy: {reason}. Please retry shortly."},
+        headers={"Retry-After": str(RETRY_AFTER_SECONDS)}
+    )
 
 @app.get("/")
 def home():
-    return {"status": "LegalLens AI is Active"}
+    return {"status": f"LegalLens AI is {models.status().capitalize()}"}
+
+@app.get("/health")
+def liveness():
+    """Liveness: the process is up and serving HTTP"""
+    return {"status": "alive"}
+
+@app.get("/ready")
+def readiness():
+    """Readiness: models are loaded and warmed up in this worker"""
+    body = {"status": models.status(), "load_seconds": models.load_seconds}
+    if models.error:
+        body["error"] = models.error
+    return JSONResponse(status_code=200 if models.ready else 503, content=body)
+
+@app.get("/metrics")
+def prometheus_metrics():
+    """Prometheus scrape endpoint: stage latency histograms + cache/batching gauges"""
+    cache_stats = result_cache.stats()
+    extra = metrics.gauge("legallens_cache_hits", "Result cache hits.", cache_stats["hits"])
+    extra += metrics.gauge("legallens_cache_misses", "Result cache misses.", cache_stats["misses"])
+    if models.ready:
+        batching = models.inference.stats()
+        extra += metrics.gauge("legallens_inference_queue_depth", "Chunks waiting for the model.", batching["queue_depth"])
+        extra += metrics.gauge("legallens_batch_fill_ratio", "Mean micro-batch fill ratio.", batching["batch_fill_ratio"])
+        if "cascade" in batching:
+            extra += metrics.gauge("legallens_cascade_escalation_rate", "Share of all clauses sent to the transformer.",
+                                   batching["cascade"]["escalation_rate"])
+    return PlainTextResponse(metrics.render(extra), media_type="text/plain; version=0.0.4")
+
+@app.get("/cache/stats")
+def cache_stats():
+    return result_cache.stats()
+
+@app.get("/inference/stats")
+def inference_stats():
+    if not models.ready:
+        return readiness()
+    return models.inference.stats()
 
 @app.post("/analyze")
-async def analyze_document(file: UploadFile = File(...)):
+async def analyze_document(file: UploadFile = File(...), timings: bool = False, previous: Optional[str] = None):
     """
     The Master Pipeline:
     1. Save File -> 2. Preprocess -> 3. OCR -> 4. Classify -> 5. Detect Risk
+    Identical uploads are answered from the result cache, and clauses seen
+    before (in any document) reuse their cached model results.
+    Blocking stages run on executors so the event loop stays responsive.
+    Pass ?timings=true to get a per-stage latency breakdown in the response.
+    Pass ?previous=<fingerprint of an earlier version> to get "changes".
     """
-    request_id = str(uuid.uuid4())
-    temp_filename = f"temp_{request_id}_{file.filename}"
-    
+    if not models.ready:
+        return overloaded_response("models are still loading")
+    if admission.locked():
+        return overloaded_response("too many documents in progress")
+
+    timer = metrics.RequestTimings()
+    async with admission:
+        result = await _analyze(file, timer, previous)
+        timer.finish()
+        if timings and isinstance(result, dict):
+            result = {**result, "timings": timer.summary()}
+        return result
+
+async def _analyze(file, timer, previous=None):
+    loop = asyncio.get_running_loop()
+    judge, matcher, clauses = models.judge, models.matcher, models.clauses
+    document = None
+
     try:
-        # Step 1: Save
-        with open(temp_filename, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        
-        print(f"📄 Processing: {file.filename}")
-
-        # Step 2: Preprocessing
-        cleaned_image = preprocess.preprocess_image(temp_filename)
-        
-        # Step 3: OCR
-        full_text, text_blocks = ocr_engine.extract_text(cleaned_image)
-        print(f"🔍 OCR Found {len(text_blocks)} text blocks.")
-        
-        # Step 4 & 5: Analysis
-        analyzed_risks = []
-        
-        for idx, block in enumerate(text_blocks):
-            text = block['text']
-            
-            # Filter out tiny noise (page numbers, etc.)
-            if len(text) < 5: continue
-
-            # A. Classify
-            category, confidence = classifier.classify_block(text)
-            
-            # DEBUG LOG (See what's happening in Terminal)
-            print(f"   👉 Block: '{text[:20]}...' | Cat: {category} | Conf: {confidence}%")
-
-            # --- IMPROVED LOGIC ---
-            
-            current_risk = None
-
-            # Path 1: High Confidence AI Prediction
-            # We lowered the threshold from 50 -> 35 to catch more clauses
-            if confidence > 35: 
-                current_risk = judge.analyze_risk(category, text)
-
-            # Path 2: Safety Net (Keyword Check)
-            # If AI missed it (low confidence), but text has "danger words", force a check.
-            elif any(word in text.lower() for word in ['terminate', 'indemnify', 'increase', 'retain', 'evict', 'penalty']):
-                print(f"   ⚠️ Keyword Triggered Safety Net for: {text[:15]}...")
-                # Force the judge to look at it as a potential risk
-                current_risk = judge.analyze_risk("Potential Clause", text)
-
-            # If we found a risk in either path, save it
-            if current_risk and current_risk['score'] > 0:
-                analyzed_risks.append({
-                    "id": idx + 1,
-                    "category": category if confidence > 35 else "General Clause", # Fallback name
-                    "text": text,
-                    "confidence": f"{confidence}%",
-                    "type": current_risk['level'],
-                    "score": current_risk['score'],
-                    "explanation": current_risk['explanation']
-                })
-
-        # Cleanup
-        if os.path.exists(temp_filename):
-            os.remove(temp_filename)
-        
-        print(f"✅ Found {len(analyzed_risks)} risks.")
-
-        return {
-            "filename": file.filename,
-            "summary": f"Scanned {len(text_blocks)} text blocks. Found {len(analyzed_risks)} issues.",
-            "risks": analyzed_risks
-        }
+        # Step 1: Receive (streamed, size-capped and fingerprinted in one pass;
+        # held in memory, only spooled to a temp file when it is large)
+        with timer.span("receive"):
+            document = await loop.run_in_executor(io_pool, uploads.receive, file.file, file.filename)
+        timer.count("bytes", document.size)
+
+        cache_key = cache.make_key(document.content_hash, *models.versions())
+        with timer.span("cache_lookup"):
+            cached = await loop.run_in_executor(io_pool, result_cache.get, cache_key)
+        if cached is not None:
+            logger.info("⚡ Cache hit: %s", file.filename)
+            timer.count("cached", True)
+            cached = {**cached, "filename": file.filename, "fingerprint": document.content_hash}
+            return await _with_changes(cached, previous, document.content_hash)
+
+        logger.info("📄 Processing: %s", file.filename)
+
+        # Step 2 & 3: Preprocessing + OCR on the OCR process pool
+        with timer.span("ocr"):
+            words = await loop.run_in_executor(io_pool, pipeline.ocr_document, document.source, timer)
+
+        # Step 3b: Rebuild clause-sized units (text_granularity_v1.md)
+        with timer.span("segment"):
+            text_blocks = segmenter.segment_clauses(words)
+        timer.count("pages", pipeline.count_pages(words))
+        timer.count("blocks", len(text_blocks))
+        logger.info("🔍 OCR Found %d words in %d clauses.", len(words), len(text_blocks))
+
+        # Step 4: Classify the clauses not in the clause cache, micro-batched
+        # with every other document in flight, while the semantic matcher
+        # embeds the same clauses on a thread
+        candidates = pipeline.select_candidates(text_blocks)
+        texts = [text for _, text in candidates]
+        with timer.span("classify"):
+            entries, missing = await loop.run_in_executor(io_pool, clauses.lookup, texts)
+            todo = [texts[i] for i in missing]
+            # Submitting runs the cascade prefilter, so off the event loop
+            classified = asyncio.wrap_future(await loop.run_in_executor(io_pool, models.inference.submit, todo))
+            if matcher is not None and todo:
+                # The encoder has its own thread; don't hold an io thread for it
+                matched = asyncio.wrap_future(matcher.submit(todo))
+                new_predictions, new_matches = await asyncio.gather(classified, matched)
+            else:
+                new_predictions, new_matches = await classified, None
+            predictions, matches = await loop.run_in_executor(
+                io_pool, clauses.fill, texts, entries, missing, new_predictions, new_matches
+            )
+        timer.count("model_texts", len(todo))
+        timer.count("reused_clauses", len(texts) - len(todo))
+
+        # Step 5: Detect Risk
+        with timer.span("risk"):
+            analyzed_risks = pipeline.assess_risks(judge, text_blocks, candidates, predictions, matches)
+        logger.info("✅ Found %d risks.", len(analyzed_risks))
+
+        result = pipeline.build_result(file.filename, len(text_blocks), analyzed_risks)
+        manifest = clause_cache.build_manifest(text_blocks, analyzed_risks)
+        await loop.run_in_executor(io_pool, pipeline.finish_result, result, document.content_hash, clauses, manifest)
+        await loop.run_in_executor(io_pool, result_cache.put, cache_key, result)
+        return await _with_changes(result, previous, document.content_hash)
+
+    except (uploads.UploadTooLarge, preprocess.PageTooLarge) as e:
+        return JSONResponse(status_code=413, content={"error": str(e)})
+
+    except pipeline.Overloaded as e:
+        return overloaded_response(str(e))
 
     except Exception as e:
-        print(f"❌ Error: {str(e)}")
-        if os.path.exists(temp_filename):
-            os.remove(temp_filename)
+        logger.exception("❌ Error: %s", e)
         return {"error": str(e)}
 
+    finally:
+        # Cleanup (drops the buffer / deletes the spool file)
+        if document is not None:
+            document.close()
+
+@app.post("/analyze/batch")
+async def analyze_batch(files: List[UploadFile] = File(...)):
+    """
+    Many documents in one call: a zip archive or several files.
+    Responds with JSON lines (application/x-ndjson), one per document in
+    the order they finish. Documents are analyzed concurrently; their pages
+    share the OCR pool and their clauses share classifier batches.
+    A batch occupies one admission slot for its whole duration.
+    """
+    if not models.ready:
+        return overloaded_response("models are still loading")
+    if admission.locked():
+        return overloaded_response("too many documents in progress")
+
+    loop = asyncio.get_running_loop()
+    archive = None
+    received = []
+    if len(files) == 1:
+        try:
+            archive = await loop.run_in_executor(
+                io_pool, uploads.receive, files[0].file, files[0].filename, batch.BATCH_MAX_UPLOAD_BYTES
+            )
+        except uploads.UploadTooLarge as e:
+            return JSONResponse(status_code=413, content={"error": str(e)})
+
+    if archive is not None and batch.is_zip(archive.source):
+        documents = batch.iter_zip(archive.source)
+    elif archive is not None:
+        # A single plain document
+        documents = [(archive.filename, lambda: archive)]
+        archive = None
+    else:
+        # FastAPI closes the UploadFiles once this returns, before the
+        # stream runs: receive them all now, analyze them lazily
+        received = await loop.run_in_executor(io_pool, _receive_all, files)
+        documents = [(filename, opener) for filename, opener, _ in received]
+
+    await admission.acquire()
+    lines = (batch.to_json_line(r) for r in batch.iter_results(documents, models, result_cache))
+
+    async def stream():
+        try:
+            async for line in iterate_in_threadpool(lines):
+                yield line
+        finally:
+            admission.release()
+            if archive is not None:
+                archive.close()
+            # Documents the stream never got to (e.g. client went away)
+            for _, _, document in received:
+                if document is not None:
+                    document.close()
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+def _receive_all(files):
+    """
+    (filename, opener, document) for every upload of a batch. A file that
+    can't be received (e.g. over the size cap) becomes that document's error
+    line instead of failing the whole batch.
+    """
+    received = []
+    for f in files:
+        try:
+            document = uploads.receive(f.file, f.filename)
+            received.append((f.filename, lambda document=document: document, document))
+        except Exception as e:
+            def opener(e=e):
+                raise e
+            received.append((f.filename, opener, None))
+    return received
+
+@app.post("/jobs", status_code=202)
+async def create_job(file: UploadFile = File(...)):
+    """
+    Queues a document for background analysis and returns at once.
+    Poll GET /jobs/{id} or follow GET /jobs/{id}/events for per-page results.
+    """
+    loop = asyncio.get_running_loop()
+    try:
+        document = await loop.run_in_executor(
+            io_pool, uploads.receive, file.file, file.filename, jobs.JOB_MAX_UPLOAD_BYTES
+        )
+    except uploads.UploadTooLarge as e:
+        return JSONResponse(status_code=413, content={"error": str(e)})
+
+    with document:
+        job_id = await loop.run_in_executor(io_pool, job_runner.submit, document)
+    logger.info("🗂️  Queued job %s: %s", job_id, file.filename)
+
+    return {
+        "id": job_id,
+        "status": jobs.QUEUED,
+        "status_url": f"/jobs/{job_id}",
+        "events_url": f"/jobs/{job_id}/events",
+    }
+
+@app.get("/jobs/{job_id}")
+def job_status(job_id: str):
+    """Progress (pages done / total) and every risk found so far"""
+    job = job_store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job")
+    return jobs.describe(job, job_store.pages(job_id))
+
+@app.get("/jobs/{job_id}/events")
+def job_events(job_id: str):
+    """
+    Server-Sent Events: one "page" event per finished page (with its
+    risks), then a final "done" or "failed" event with the job status.
+    Pages finished before the client connected are replayed first.
+    """
+    if job_store.get(job_id) is None:
+        raise HTTPException(status_code=404, detail="Unknown job")
+    return StreamingResponse(
+        _job_events(job_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+async def _job_events(job_id):
+    loop = asyncio.get_running_loop()
+    next_page = 0
+
+    while True:
+        # Status first: if it says finished, every page is already stored
+        job = await loop.run_in_executor(io_pool, job_store.get, job_id)
+        pages = await loop.run_in_executor(io_pool, job_store.pages, job_id, next_page)
+
+        for page in pages:
+            yield jobs.format_event("page", {
+                "page": page["page"] + 1,
+                "pages_total": job["pages_total"],
+                "risks": page["risks"],
+            })
+            next_page = page["page"] + 1
+
+        if job["status"] in jobs.FINISHED:
+            yield jobs.format_event(job["status"], jobs.describe(job))
+            return
+
+        await asyncio.sleep(EVENT_POLL_SECONDS)
+
+async def _with_changes(result, previous, fingerprint):
+    """Adds what changed since `previous`, the fingerprint of an earlier version"""
+    if not previous:
+        return result
+
+    loop = asyncio.get_running_loop()
+    old = await loop.run_in_executor(io_pool, models.clauses.load_manifest, previous)
+    new = await loop.run_in_executor(io_pool, models.clauses.load_manifest, fingerprint)
+    if old is None or new is None:
+        changes = {"previous": previous, "error": "No analysis of the previous version is on record."}
+    else:
+        changes = {"previous": previous, **clause_cache.diff(old, new)}
+    return {**result, "changes": changes}
+
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,135 @@
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# --- CONFIGURATION ---
+LOG_LEVEL = os.environ.get("LEGALLENS_LOG_LEVEL", "INFO").upper()
+
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 5000)
+BYTES_BUCKETS = (10e3, 100e3, 500e3, 1e6, 5e6, 10e6, 25e6, 50e6, 100e6)
+RATIO_BUCKETS = (0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1)
+
+
+def setup_logging(level=LOG_LEVEL):
+    logging.basicConfig(level=level, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+
+class Histogram:
+    """A minimal thread-safe Prometheus histogram with optional labels"""
+
+    def __init__(self, name, help_text, buckets=SECONDS_BUCKETS, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(buckets)
+        self.labelnames = tuple(labelnames)
+        self._series = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            series = self._series.setdefault(key, {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0})
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series["buckets"][i] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                labels = [f'{name}="{value}"' for name, value in zip(self.labelnames, key)]
+                bounds = [f"{bound:g}" for bound in self.buckets] + ["+Inf"]
+                for bound, count in zip(bounds, series["buckets"] + [series["count"]]):
+                    le = 'le="' + bound + '"'
+                    lines.append(f"{self.name}_bucket{_labels(labels + [le])} {count}")
+                lines.append(f"{self.name}_sum{_labels(labels)} {series['sum']:.6f}")
+                lines.append(f"{self.name}_count{_labels(labels)} {series['count']}")
+        return lines
+
+
+def _labels(pairs):
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def gauge(name, help_text, value):
+    """Exposition lines for a point-in-time value (cache stats etc.)"""
+    return [f"# HELP {name} {help_text}", f"# TYPE {name} gauge", f"{name} {value}"]
+
+
+REGISTRY = []
+
+STAGE_SECONDS = Histogram(
+    "legallens_stage_seconds",
+    "Time spent per pipeline stage (rasterize/preprocess/tesseract are per page).",
+    labelnames=("stage",),
+)
+REQUEST_SECONDS = Histogram("legallens_request_seconds", "End-to-end /analyze latency.")
+DOCUMENT_PAGES = Histogram("legallens_document_pages", "Pages per analyzed document.", COUNT_BUCKETS)
+DOCUMENT_BLOCKS = Histogram("legallens_document_blocks", "Clause blocks per analyzed document.", COUNT_BUCKETS)
+DOCUMENT_BYTES = Histogram("legallens_document_bytes", "Upload size per analyzed document.", BYTES_BUCKETS)
+MODEL_BATCH_SIZE = Histogram("legallens_model_batch_size", "Texts per classifier forward batch.", COUNT_BUCKETS)
+CASCADE_ESCALATION_RATIO = Histogram(
+    "legallens_cascade_escalation_ratio",
+    "Share of a submission's clauses the cascade prefilter sent on to the transformer.",
+    RATIO_BUCKETS,
+)
+
+
+def render(extra_lines=()):
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    lines.extend(extra_lines)
+    return "\n".join(lines) + "\n"
+
+
+class RequestTimings:
+    """
+    Per-request timing spans. Every span also feeds STAGE_SECONDS, and the
+    whole breakdown can be returned with the /analyze response.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = {}
+        self.counts = {}
+
+    @contextmanager
+    def span(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - start)
+
+    def add(self, stage, seconds):
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+        STAGE_SECONDS.observe(seconds, stage=stage)
+
+    def count(self, name, value):
+        self.counts[name] = value
+
+    def finish(self):
+        """Records the document-level histograms; returns total seconds"""
+        total = time.perf_counter() - self.started
+        REQUEST_SECONDS.observe(total)
+        if "pages" in self.counts:
+            DOCUMENT_PAGES.observe(self.counts["pages"])
+        if "blocks" in self.counts:
+            DOCUMENT_BLOCKS.observe(self.counts["blocks"])
+        if "bytes" in self.counts:
+            DOCUMENT_BYTES.observe(self.counts["bytes"])
+        return total
+
+    def summary(self):
+        return {
+            "total_ms": round((time.perf_counter() - self.started) * 1000, 1),
+            "stages_ms": {stage: round(seconds * 1000, 1) for stage, seconds in self.stages.items()},
+            **self.counts,
+        }
@@ -0,0 +1,147 @@
+import gc
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# --- CONFIGURATION ---
+# Load the models at import time. Use with `gunicorn --preload` so the master
+# loads the weights once and forked workers share them copy-on-write.
+PRELOAD = os.environ.get("LEGALLENS_PRELOAD", "0") == "1"
+
+# Short and long inputs, so the first real request doesn't pay for
+# lazy kernel initialisation / thread pool spin-up
+WARMUP_TEXTS = [
+    "The monthly rent shall be INR 25,000 payable in advance.",
+    "Tenant shall indemnify the Landlord against all losses and damages arising "
+    "out of any breach of this agreement, including legal costs and any damage "
+    "to fixtures, fittings or the structure of the premises.",
+]
+
+
+class ServiceModels:
+    """
+    Holds the heavy objects of the service and loads them on demand.
+
+    torch / transformers are only imported inside load(), so importing the
+    web app (and binding its port) stays fast. The weights are loaded once
+    per process, or once per master when PRELOAD is set. The inference
+    thread is always started in the process that serves requests, because
+    threads do not survive a fork.
+    """
+
+    def __init__(self):
+        self.classifier = None
+        self.judge = None
+        self.matcher = None
+        self.cascade = None
+        self.clauses = None
+        self.inference = None
+        self.error = None
+        self.load_seconds = None
+        self._lock = threading.Lock()
+        self._inference_pid = None
+
+    @property
+    def loaded(self):
+        return self.classifier is not None
+
+    @property
+    def ready(self):
+        return self.loaded and self.inference is not None and self._inference_pid == os.getpid()
+
+    def load(self):
+        """Loads the models (idempotent, thread-safe)"""
+        with self._lock:
+            if self.loaded:
+                return self
+            try:
+                start = time.perf_counter()
+                logger.info("⏳ Loading AI Models... Please wait.")
+
+                from classifier import ClauseClassifier
+                from risk_detector import RiskDetector
+                import cascade
+                import semantic
+
+                self.judge = RiskDetector()
+                self.matcher = semantic.load()
+                self.classifier = ClauseClassifier()
+                # Blocks with danger words are never dismissed by the prefilter
+                self.cascade = cascade.load(guard=cascade.safety_net_guard(self.judge))
+                self.load_seconds = round(time.perf_counter() - start, 2)
+                self.error = None
+                logger.info("✅ Models loaded in %ss", self.load_seconds)
+            except Exception as e:
+                self.error = str(e)
+                logger.exception("❌ Model loading failed: %s", e)
+                raise
+
+            if PRELOAD:
+                # Keep the GC from touching (and so copying) the shared pages
+                gc.collect()
+                gc.freeze()
+
+        return self
+
+    def start(self):
+        """
+        Loads if needed, then warms up and starts this process's inference
+        thread. Warmup runs post-fork: torch's intra-op thread pool must not
+        be spun up in a master that is going to fork.
+        """
+        self.load()
+        with self._lock:
+            if self._inference_pid != os.getpid():
+                from clause_cache import ClauseCache
+                from inference import InferenceScheduler
+
+                logger.info("🔥 Warming up the classifier...")
+                self.classifier.classify_batch(WARMUP_TEXTS)
+                if self.matcher is not None:
+                    self.matcher.match(WARMUP_TEXTS)
+
+                # Per process: its SQLite store must not be shared across fork()
+                # Clause results only depend on the models, not on the rules
+                self.clauses = ClauseCache((self._classifier_version(), self._matcher_version()))
+                self.inference = InferenceScheduler(self.classifier, cascade=self.cascade)
+                self._inference_pid = os.getpid()
+                logger.info("✅ LegalLens AI Service is Ready!")
+        return self
+
+    def _classifier_version(self):
+        if self.cascade is None:
+            return self.classifier.model_version
+        return f"{self.classifier.model_version}+cascade-{self.cascade.version}"
+
+    def _matcher_version(self):
+        return self.matcher.fingerprint() if self.matcher is not None else "rules-only"
+
+    def versions(self):
+        """Everything that can change a verdict, for result cache keys"""
+        return self._classifier_version(), self.judge.fingerprint(), self._matcher_version()
+
+    def start_in_background(self):
+        def run():
+            try:
+                self.start()
+            except Exception as e:
+                # Reported by /ready
+                self.error = self.error or str(e)
+
+        threading.Thread(target=run, name="model-loader", daemon=True).start()
+
+    def status(self):
+        if self.ready:
+            return "ready"
+        if self.error:
+            return "error"
+        return "loading"
+
+
+models = ServiceModels()
+
+if PRELOAD:
+    models.load()
@@ -1,56 +1,311 @@
 import cv2
 import pytesseract
-from pdf2image import convert_from_path
+from pdf2image import convert_from_bytes, convert_from_path, pdfinfo_from_bytes, pdfinfo_from_path
 import numpy as np
 from PIL import Image
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, wait
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+
+import preprocess
+import text_layer
 
 # Windows tesseract path
 pytesseract.pytesseract.tesseract_cmd = r"C:\Program Files\Tesseract-OCR\tesseract.exe"
 
-def extract_text(file_path):
+# --- CONFIGURATION ---
+RASTER_DPI = 300
+OCR_WORKERS = int(os.environ.get("LEGALLENS_OCR_WORKERS", os.cpu_count() or 1))
+# Pages rasterized/OCR'd at the same time. Peak memory is ~this many pages.
+MAX_PAGES_IN_FLIGHT = int(os.environ.get("LEGALLENS_MAX_PAGES_IN_FLIGHT", OCR_WORKERS * 2))
+# Page image memory one request may hold at once. Its pages in flight are
+# capped so that this many worst-case (MAX_PAGE_PIXELS) pages fit.
+REQUEST_MEMORY_MB = int(os.environ.get("LEGALLENS_REQUEST_MEMORY_MB", 2048))
+
+logger = logging.getLogger(__name__)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def _get_pool():
+    """One shared OCR process pool per service process"""
+    global _pool
+    if _pool is None:
+        # Two io threads' first OCR requests must not both create one
+        with _pool_lock:
+            if _pool is None:
+                _pool = ProcessPoolExecutor(max_workers=OCR_WORKERS, initializer=preprocess.mark_pool_worker)
+    return _pool
+
+def run_in_pool(fn, *args):
+    """Runs a picklable OCR/preprocess task on the pool and waits for it"""
+    if OCR_WORKERS <= 1:
+        return fn(*args)
+    return _get_pool().submit(fn, *args).result()
+
+def _parse_conf(value):
+    """Tesseract reports conf as str/int/float depending on version; -1 means none"""
+    try:
+        return max(int(float(value)), 0)
+    except (TypeError, ValueError):
+        return 0
+
+def is_pdf(file_path):
+    """`file_path` may also be the raw bytes of an upload held in memory"""
+    if isinstance(file_path, (bytes, bytearray)):
+        return file_path[:5] == b"%PDF-"
+    return isinstance(file_path, str) and file_path.lower().endswith(".pdf")
+
+def count_pages(file_path):
+    """Page count without rasterizing anything"""
+    if not is_pdf(file_path):
+        return 1
+    if isinstance(file_path, (bytes, bytearray)):
+        return int(pdfinfo_from_bytes(file_path)["Pages"])
+    return int(pdfinfo_from_path(file_path)["Pages"])
+
+def pages_within_budget():
+    """Pages one request may have in flight without exceeding REQUEST_MEMORY_MB"""
+    page_bytes = preprocess.MAX_PAGE_PIXELS * preprocess.PAGE_WORKING_COPIES
+    return max(REQUEST_MEMORY_MB * 1024 * 1024 // page_bytes, 1)
+
+def page_size_points(file_path, page_index):
+    """A PDF page's (width, height) in points from pdfinfo, or None if unknown"""
+    info = pdfinfo_from_bytes if isinstance(file_path, (bytes, bytearray)) else pdfinfo_from_path
+    fields = info(file_path, first_page=page_index + 1, last_page=page_index + 1)
+    # "Page size" for one page, "Page    N size" when a range is given
+    for key, value in fields.items():
+        if key.startswith("Page") and key.endswith("size"):
+            match = re.match(r"([\d.]+) x ([\d.]+) pts", str(value))
+            if match:
+                return float(match.group(1)), float(match.group(2))
+    return None
+
+def raster_dpi(file_path, page_index):
     """
-    Safely extract text from PDF or image
+    The DPI that keeps a page within the memory budget, decided from its
+    size before anything is rendered; raises PageTooLarge if it can't fit.
     """
-    images = []
+    size = page_size_points(file_path, page_index)
+    if size is None:
+        return RASTER_DPI
+    width, height = (int(points / 72 * RASTER_DPI) for points in size)
+    return max(int(RASTER_DPI * preprocess.page_scale(width, height)), 1)
 
-    # 1️⃣ PDF → images
-    if file_path.lower().endswith(".pdf"):
-        pil_images = convert_from_path(file_path, dpi=300)
-        for img in pil_images:
-            images.append(np.array(img))
-    else:
-        img = cv2.imread(file_path)
-        if img is not None:
-            images.append(img)
+def rasterize_page(file_path, page_index):
+    """
+    Renders a single PDF page (0-based) straight to a grayscale array.
+    The array wraps the rendered pixels without another copy (read-only).
+    A page over the memory budget is rendered at a lower DPI (or rejected)
+    up front, so the full-size bitmap never exists.
+    """
+    convert = convert_from_bytes if isinstance(file_path, (bytes, bytearray)) else convert_from_path
+    pil_images = convert(
+        file_path, dpi=raster_dpi(file_path, page_index),
+        first_page=page_index + 1, last_page=page_index + 1,
+        grayscale=True
+    )
+    page = np.asarray(pil_images[0])
+    pil_images[0].close()
+    # Rounding, or a page pdfinfo couldn't size
+    return preprocess.fit_to_budget(page)
 
-    if not images:
-        print("❌ OCR ERROR: No images extracted")
-        return "", []
+def ocr_image(img, page_index=0):
+    """
+    OCR one page image into word dicts with layout numbers and boxes.
+    """
+    gray = img if img.ndim == 2 else cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
 
-    full_text = ""
-    blocks = []
+    # --psm 3: automatic page segmentation, so Tesseract reports real
+    # block / paragraph / line numbers for the clause segmenter
+    data = pytesseract.image_to_data(
+        gray,
+        output_type=pytesseract.Output.DICT,
+        config="--oem 3 --psm 3"
+    )
 
-    # 2️⃣ OCR each image
-    for img in images:
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    words = []
+    for i in range(len(data["text"])):
+        text = data["text"][i].strip()
+        if text == "":
+            continue
 
-        data = pytesseract.image_to_data(
-            gray,
-            output_type=pytesseract.Output.DICT,
-            config="--oem 3 --psm 6"
-        )
+        left, top = data["left"][i], data["top"][i]
+        words.append({
+            "text": text,
+            "confidence": _parse_conf(data["conf"][i]),
+            "page": page_index,
+            "block": data["block_num"][i],
+            "par": data["par_num"][i],
+            "line": data["line_num"][i],
+            "bbox": (left, top, left + data["width"][i], top + data["height"][i])
+        })
 
-        for i in range(len(data["text"])):
-            text = data["text"][i].strip()
-            if text == "":
-                continue
+    return words
 
-            conf = int(data["conf"][i]) if data["conf"][i].isdigit() else 0
+def timed(stages, stage, fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    stages[stage] = time.perf_counter() - start
+    return result
 
-            full_text += text + " "
-            blocks.append({
-                "text": text,
-                "confidence": conf
-            })
+def _ocr_pdf_page(file_path, page_index):
+    """
+    Worker task: rasterize + clean up + OCR one page, so only the worker holds
+    the pixels. Returns (words, seconds per stage) for the metrics.
+    """
+    stages = {}
+    # This worker's scratch arrays, reused from page to page (None when run inline)
+    buffers = preprocess.page_buffers()
+    page = timed(stages, "rasterize", rasterize_page, file_path, page_index)
+    page = timed(stages, "preprocess", preprocess.preprocess_image, page, None, buffers)
+    words = timed(stages, "tesseract", ocr_image, page, page_index)
+    return words, stages
+
+def record_stages(timings, stages):
+    """Feeds worker-side stage seconds into a request's metrics.RequestTimings"""
+    if timings is not None:
+        for stage, seconds in stages.items():
+            timings.add(stage, seconds)
+
+def _native_pages(file_path):
+    """
+    Returns page_index -> words from the PDF text layer, or None when the
+    page must be OCR'd. Pages must be requested in increasing order
+    (pdfminer streams); skipped pages are parsed and dropped.
+    """
+    pages = None
+    position = 0
+    if is_pdf(file_path) and text_layer.is_available():
+        pages = text_layer.iter_pdf_words(file_path, dpi=RASTER_DPI)
+
+    def lookup(page_index):
+        nonlocal pages, position
+        if pages is None:
+            return None
+        try:
+            while position < page_index:
+                next(pages)
+                position += 1
+            words = next(pages)
+            position += 1
+        except Exception as e:
+            # Broken/encrypted text layer: OCR the rest of the document
+            logger.warning("⚠️ Text layer unreadable from page %d: %s", page_index + 1, e)
+            pages = None
+            return None
+        return words if text_layer.is_usable(words) else None
+
+    return lookup
+
+def _spool_pdf(data):
+    """Writes an in-memory PDF to one temp file the OCR workers can all read"""
+    fd, path = tempfile.mkstemp(suffix=".pdf", prefix="legallens-")
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+    return path
+
+def iter_page_words(file_path, workers=None, max_in_flight=None, use_text_layer=True, timings=None, start=0):
+    """
+    Yields the word list of every page from `start` on, in page order.
+
+    Born-digital pages are read from the embedded text layer; only pages
+    without a usable one are rasterized + OCR'd. Those are rasterized
+    lazily inside the OCR workers, and at most `max_in_flight` pages are
+    pending at once (fewer if REQUEST_MEMORY_MB requires), so peak memory
+    is O(workers) pages, not O(document).
+    Stage seconds are added to `timings` (metrics.RequestTimings) if given.
+    """
+    workers = OCR_WORKERS if workers is None else workers
+    max_in_flight = MAX_PAGES_IN_FLIGHT if max_in_flight is None else max_in_flight
+    max_in_flight = max(min(max_in_flight, pages_within_budget()), 1)
+    page_count = count_pages(file_path)
+    lookup = _native_pages(file_path) if use_text_layer else (lambda page_index: None)
+
+    def native(page_index):
+        start = time.perf_counter()
+        words = lookup(page_index)
+        record_stages(timings, {"text_layer": time.perf_counter() - start})
+        return words
+
+    def finish(result):
+        words, stages = result
+        record_stages(timings, stages)
+        return words
+
+    # An upload held in memory is written to disk once, on the first page
+    # that needs OCR, instead of pickling the bytes to a worker (and
+    # pdf2image spooling them again) for every page
+    spooled = None
+
+    def ocr_source():
+        nonlocal spooled
+        if not isinstance(file_path, (bytes, bytearray)):
+            return file_path
+        if spooled is None:
+            spooled = _spool_pdf(file_path)
+        return spooled
+
+    in_flight = deque()
+    try:
+        # Single core: no point paying for process hops
+        if workers <= 1 or page_count - start <= 1:
+            for page_index in range(start, page_count):
+                words = native(page_index)
+                yield words if words is not None else finish(_ocr_pdf_page(ocr_source(), page_index))
+            return
+
+        pool = _get_pool()
+        next_page = start
+
+        while next_page < page_count or in_flight:
+            # Top up the window
+            while next_page < page_count and len(in_flight) < max_in_flight:
+                words = native(next_page)
+                if words is None:
+                    words = pool.submit(_ocr_pdf_page, ocr_source(), next_page)
+                in_flight.append(words)
+                next_page += 1
+
+            # Oldest first keeps the output in page order
+            page = in_flight.popleft()
+            yield finish(page.result()) if isinstance(page, Future) else page
+    finally:
+        if spooled is not None:
+            # Abandoned early: workers may still be reading the spooled file
+            pending = [page for page in in_flight if isinstance(page, Future) and not page.cancel()]
+            wait(pending)
+            os.remove(spooled)
+
+def extract_text(file_path):
+    """
+    Safely extract text from PDF or image.
+    Accepts a file path, the file's raw bytes, or an already loaded
+    (e.g. preprocessed) image array.
+    """
+    # 1️⃣ Collect the words of every page
+    if isinstance(file_path, np.ndarray):
+        pages = [ocr_image(file_path)]
+    elif is_pdf(file_path):
+        pages = iter_page_words(file_path)
+    elif isinstance(file_path, (bytes, bytearray)):
+        img = cv2.imdecode(np.frombuffer(file_path, dtype=np.uint8), cv2.IMREAD_COLOR)
+        pages = [ocr_image(img)] if img is not None else []
+    else:
+        img = cv2.imread(file_path)
+        pages = [ocr_image(img)] if img is not None else []
+
+    blocks = []
+    for words in pages:
+        blocks.extend(words)
+
+    if not blocks:
+        logger.error("❌ OCR ERROR: No text extracted")
+        return "", []
 
-    return full_text.strip(), blocks
+    return " ".join(w["text"] for w in blocks), blocks
@@ -0,0 +1,208 @@
+import logging
+
+import clause_cache
+import ocr_engine
+import preprocess
+import segmenter
+import semantic
+
+logger = logging.getLogger(__name__)
+
+# Below this confidence the model's label is not trusted on its own
+CONFIDENCE_THRESHOLD = 35
+# Blocks shorter than this are noise (page numbers, etc.)
+MIN_BLOCK_CHARS = 5
+
+
+class Overloaded(Exception):
+    """Raised when a stage queue is full; the API turns it into a 503"""
+
+
+def _ocr_scan(file_path):
+    """Process-pool task: clean up a scan/photo and OCR it; returns (words, stage seconds)"""
+    stages = {}
+    buffers = preprocess.page_buffers()
+    page = ocr_engine.timed(stages, "preprocess", preprocess.preprocess_image, file_path, None, buffers)
+    words = ocr_engine.timed(stages, "tesseract", ocr_engine.ocr_image, page)
+    return words, stages
+
+
+def count_document_pages(file_path):
+    """Pages in a PDF; a scan/photo is a single page"""
+    return ocr_engine.count_pages(file_path) if ocr_engine.is_pdf(file_path) else 1
+
+
+def iter_document_pages(file_path, timings=None, start=0):
+    """
+    Yields (page_index, words) for every page from `start` on, in order,
+    as soon as each page is OCR'd (or read from the PDF text layer).
+    """
+    if ocr_engine.is_pdf(file_path):
+        # PDF pages are rasterized and OCR'd page by page inside the pool
+        pages = ocr_engine.iter_page_words(file_path, timings=timings, start=start)
+        yield from enumerate(pages, start=start)
+        return
+
+    if start == 0:
+        words, stages = ocr_engine.run_in_pool(_ocr_scan, file_path)
+        ocr_engine.record_stages(timings, stages)
+        yield 0, words
+
+
+def ocr_document(file_path, timings=None):
+    """
+    Stage: Preprocess + OCR (CPU bound, runs on the OCR process pool).
+    `file_path` may be a path or the document's bytes.
+    Returns the word dicts of every page in order; per-stage seconds go
+    into `timings` (metrics.RequestTimings) if given.
+    """
+    return [w for _, page in iter_document_pages(file_path, timings) for w in page]
+
+
+def count_pages(words):
+    return words[-1]["page"] + 1 if words else 0
+
+
+def select_candidates(text_blocks):
+    """(index, text) of every block worth sending to the model"""
+    return [(idx, block['text']) for idx, block in enumerate(text_blocks) if len(block['text']) >= MIN_BLOCK_CHARS]
+
+
+def assess_risks(judge, text_blocks, candidates, predictions, matches=None):
+    """
+    Stage: Risk Detection
+    Combines the model's labels with the rule engine and the keyword safety net.
+    Every clause is scanned once; the scan feeds both the safety net and the rules.
+    `matches` (semantic.SemanticMatcher.match, one list per candidate) adds the
+    nearest known clauses as evidence and can raise a clause's risk.
+    """
+    texts = [text for _, text in candidates]
+    scans = [judge.scan(text) for text in texts]
+    labels = []
+
+    for text, (category, confidence, _), scan in zip(texts, predictions, scans):
+
+        # DEBUG LOG (LEGALLENS_LOG_LEVEL=DEBUG to see it in the terminal)
+        logger.debug("   👉 Block: '%s...' | Cat: %s | Conf: %s%%", text[:20], category, confidence)
+
+        # Path 1: High Confidence AI Prediction
+        # We lowered the threshold from 50 -> 35 to catch more clauses
+        if confidence > CONFIDENCE_THRESHOLD:
+            labels.append(category)
+
+        # Path 2: Safety Net (Keyword Check)
+        # If AI missed it (low confidence), but text has "danger words", force a check.
+        elif judge.needs_safety_net(scan):
+            logger.debug("   ⚠️ Keyword Triggered Safety Net for: %s...", text[:15])
+            # Force the judge to look at it as a potential risk
+            labels.append("Potential Clause")
+
+        else:
+            labels.append(None)
+
+    verdicts = judge.analyze_batch(labels, texts, scans)
+    if matches is None:
+        matches = [None] * len(candidates)
+
+    analyzed_risks = []
+    for (idx, text), (category, confidence, window), current_risk, nearest in zip(candidates, predictions, verdicts, matches):
+        if confidence <= CONFIDENCE_THRESHOLD:
+            category = "General Clause" # Fallback name
+        source = "Rule Engine"
+
+        # Path 3: Semantic Match
+        # Close to a known risky clause, and riskier than the rules say
+        similar = semantic.verdict(nearest)
+        if similar and (current_risk is None or similar['score'] > current_risk['score']):
+            current_risk = {
+                "score": similar['score'],
+                "level": similar['risk'],
+                "explanation": f"Similar to a known risky clause: {similar['explanation']}"
+            }
+            category = similar['label'] if category == "General Clause" else category
+            source = semantic.MODEL_SOURCE
+
+        # If we found a risk in any path, save it
+        if current_risk and current_risk['score'] > 0:
+            risk = {
+                "id": idx + 1,
+                "category": category,
+                "text": text,
+                "page": text_blocks[idx]['page'] + 1,
+                "bbox": text_blocks[idx]['bbox'],
+                "confidence": f"{confidence}%",
+                "type": current_risk['level'],
+                "score": current_risk['score'],
+                "explanation": current_risk['explanation'],
+                "model_source": source
+            }
+            if nearest:
+                risk["evidence"] = nearest
+            if window:
+                # Long clause: the part of the text that decided the label
+                risk["window"] = {"start": window[0], "end": window[1]}
+            analyzed_risks.append(risk)
+
+    return analyzed_risks
+
+
+def build_result(filename, block_count, analyzed_risks):
+    return {
+        "filename": filename,
+        "summary": f"Scanned {block_count} text blocks. Found {len(analyzed_risks)} issues.",
+        "risks": analyzed_risks
+    }
+
+
+def finish_result(result, fingerprint, clauses=None, manifest=None):
+    """
+    The last step of every path that caches a result: stamps the document's
+    fingerprint and records its clause manifest (clause_cache.build_manifest),
+    so any analysis can later be passed as ?previous=.
+    """
+    result["fingerprint"] = fingerprint
+    if clauses is not None and manifest is not None:
+        clauses.put_manifest(fingerprint, manifest)
+    return result
+
+
+def classify_clauses(texts, classifier, matcher=None, clauses=None):
+    """
+    Stage: Classification (+ semantic matches), blocking.
+    With a clause_cache.ClauseCache only clauses it hasn't seen are computed.
+    Returns (predictions, matches or None).
+    """
+    if clauses is not None:
+        return clauses.classify(texts, classifier, matcher)
+    # The matcher encodes on its own thread while the classifier runs
+    matched = matcher.submit(texts) if matcher is not None else None
+    predictions = classifier.classify_batch(texts)
+    return predictions, (matched.result() if matched is not None else None)
+
+
+def analyze(source, filename, classifier, judge, timings=None, matcher=None, clauses=None, fingerprint=None):
+    """
+    The whole pipeline, synchronously, in the calling thread:
+    OCR -> Segment -> Classify -> Detect Risk.
+    For scripts and background workers; `classifier` may be the
+    micro-batching scheduler, which shares batches with other callers.
+    With a `fingerprint` (the document's content hash) the result is
+    finished with finish_result, ready for the result cache.
+    """
+    words = ocr_document(source, timings)
+    text_blocks = segmenter.segment_clauses(words)
+
+    candidates = select_candidates(text_blocks)
+    texts = [text for _, text in candidates]
+    predictions, matches = classify_clauses(texts, classifier, matcher, clauses)
+    analyzed_risks = assess_risks(judge, text_blocks, candidates, predictions, matches)
+
+    if timings is not None:
+        timings.count("pages", count_pages(words))
+        timings.count("blocks", len(text_blocks))
+
+    result = build_result(filename, len(text_blocks), analyzed_risks)
+    if fingerprint is not None:
+        manifest = clause_cache.build_manifest(text_blocks, analyzed_risks)
+        finish_result(result, fingerprint, clauses, manifest)
+    return result
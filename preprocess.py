@@ -1,11 +1,254 @@
 import cv2
 import numpy as np
+import logging
 import os
+import threading
 
-def preprocess_image(image_path):
+logger = logging.getLogger(__name__)
+
+# --- CONFIGURATION ---
+# "fast": adaptive denoise + skew estimated on a thumbnail (default)
+# "full": the original full-resolution pipeline
+PREPROCESS_MODE = os.environ.get("LEGALLENS_PREPROCESS_MODE", "fast")
+
+# Estimated noise sigma (grey levels) below which a scan counts as clean,
+# and above which the expensive non-local-means denoiser is used
+CLEAN_NOISE_SIGMA = 2.5
+HEAVY_NOISE_SIGMA = 8.0
+# Noise is measured on a centre crop of at most this many pixels per side
+NOISE_SAMPLE_SIZE = 1024
+
+# Skew is searched on a copy whose longest side is this long
+SKEW_SAMPLE_SIZE = 1000
+MAX_SKEW_DEGREES = 15
+# Profile variance spread (relative) below which a page counts as flat, i.e. not rotated
+SKEW_MIN_CONTRAST = 0.01
+
+# --- MEMORY BUDGET ---
+# Largest page image (pixels) cleaned up and OCR'd as is: A2 at 300 DPI.
+# Bigger pages are downscaled to fit, or rejected with LEGALLENS_OVERSIZED_PAGES=reject.
+MAX_PAGE_PIXELS = int(float(os.environ.get("LEGALLENS_MAX_PAGE_MEGAPIXELS", 36)) * 1_000_000)
+OVERSIZED_PAGES = os.environ.get("LEGALLENS_OVERSIZED_PAGES", "downscale")
+# Below this scale the text is too small to OCR, so the page is rejected either way
+MIN_PAGE_SCALE = 0.25
+# 8-bit page-sized arrays alive at once while a page is cleaned up (input,
+# denoised, binary, rotated): a page's working set is about this x its pixels
+PAGE_WORKING_COPIES = 4
+# Set LEGALLENS_PAGE_BUFFERS=0 to allocate fresh arrays for every page in the OCR pool workers
+PAGE_BUFFERS = os.environ.get("LEGALLENS_PAGE_BUFFERS", "1") == "1"
+
+# Power-of-two reduced decoding (JPEG decodes these straight from the DCT)
+_REDUCED_GRAYSCALE = {1: cv2.IMREAD_GRAYSCALE, 2: cv2.IMREAD_REDUCED_GRAYSCALE_2,
+                      4: cv2.IMREAD_REDUCED_GRAYSCALE_4, 8: cv2.IMREAD_REDUCED_GRAYSCALE_8}
+
+
+class PageTooLarge(ValueError):
+    """A page image beyond the memory budget that may not be downscaled"""
+
+
+class PageBuffers:
+    """
+    Page-sized scratch arrays one OCR worker reuses from page to page
+    (OpenCV writes into them through `dst=`), so after the first page a
+    worker cleans up pages without allocating. Each named buffer grows to
+    the largest page seen, which MAX_PAGE_PIXELS bounds.
+    Results live in these buffers: use them before the worker's next page.
+    """
+
+    def __init__(self):
+        self._flat = {}
+
+    def get(self, name, shape, dtype=np.uint8):
+        size = int(np.prod(shape))
+        flat = self._flat.get(name)
+        if flat is None or flat.size < size or flat.dtype != dtype:
+            flat = self._flat[name] = np.empty(size, dtype=dtype)
+        return flat[:size].reshape(shape)
+
+    def nbytes(self):
+        return sum(flat.nbytes for flat in self._flat.values())
+
+
+_local = threading.local()
+# Set in OCR pool processes only (see mark_pool_worker)
+_pool_worker = False
+
+def mark_pool_worker():
+    """OCR pool initializer: this process may keep page buffers between pages"""
+    global _pool_worker
+    _pool_worker = True
+
+def page_buffers():
+    """
+    This OCR worker's PageBuffers (one per process and thread), or None
+    outside the OCR pool: a page OCR'd inline on a server thread (io, job,
+    batch) must not keep page-sized buffers alive for the whole process.
+    """
+    if not (PAGE_BUFFERS and _pool_worker):
+        return None
+    if not hasattr(_local, "buffers"):
+        _local.buffers = PageBuffers()
+    return _local.buffers
+
+def _out(buffers, name, shape, dtype=np.uint8):
+    """A reusable dst for an OpenCV call, or None to let OpenCV allocate"""
+    return buffers.get(name, shape, dtype) if buffers is not None else None
+
+def page_scale(width, height, max_pixels=None):
+    """
+    The factor (<= 1) a width x height page is scaled by to fit the budget.
+    Raises PageTooLarge when it does not fit and may not be downscaled.
+    """
+    max_pixels = max_pixels or MAX_PAGE_PIXELS
+    if width * height <= max_pixels:
+        return 1.0
+
+    scale = (max_pixels / (width * height)) ** 0.5
+    megapixels = width * height / 1e6
+    if OVERSIZED_PAGES == "reject" or scale < MIN_PAGE_SCALE:
+        raise PageTooLarge(
+            f"Page of {width}x{height} pixels ({megapixels:.1f} MP) exceeds the "
+            f"{max_pixels / 1e6:.1f} MP page limit"
+        )
+    logger.warning("📉 Downscaling a %.0f MP page by %.2f to fit the memory budget.", megapixels, scale)
+    return scale
+
+def fit_to_budget(img, max_pixels=None):
+    """Shrinks a decoded page (e.g. a rasterized PDF page) that is over the budget"""
+    h, w = img.shape[:2]
+    scale = page_scale(w, h, max_pixels)
+    if scale == 1.0:
+        return img
+    return cv2.resize(img, (max(int(w * scale), 1), max(int(h * scale), 1)), interpolation=cv2.INTER_AREA)
+
+def _image_size(source):
+    """(width, height) from the file header alone, without decoding the pixels"""
+    from PIL import Image
+    import io
+
+    fileobj = io.BytesIO(source) if isinstance(source, (bytes, bytearray, memoryview)) else source
+    try:
+        with Image.open(fileobj) as image:
+            return image.size
+    except Image.DecompressionBombError as e:
+        raise PageTooLarge(str(e))
+    except Exception:
+        # Unknown to PIL: OpenCV gets to try, and the decoded page is checked
+        return None
+
+def load_image(source, grayscale=False, max_pixels=None):
+    """
+    Decodes an image from a file path, raw bytes (e.g. an upload held in
+    memory) or passes an already decoded array straight through.
+    With `grayscale`, files are decoded straight to one channel, and pages
+    over the memory budget are decoded at reduced size rather than in full.
+    """
+    if isinstance(source, np.ndarray):
+        return fit_to_budget(source, max_pixels) if grayscale else source
+
+    if not isinstance(source, (bytes, bytearray, memoryview)) and not os.path.exists(source):
+        raise FileNotFoundError(f"Image not found at: {source}")
+
+    flags, scale = cv2.IMREAD_COLOR, 1.0
+    if grayscale:
+        size = _image_size(source)
+        scale = page_scale(*size, max_pixels) if size else 1.0
+        # Largest power-of-two reduction that still leaves at least the target size
+        reduction = max(r for r in _REDUCED_GRAYSCALE if r <= 1.0 / scale)
+        flags, scale = _REDUCED_GRAYSCALE[reduction], scale * reduction
+
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        img = cv2.imdecode(np.frombuffer(source, dtype=np.uint8), flags)
+    else:
+        img = cv2.imread(source, flags)
+
+    if img is None:
+        raise ValueError("Could not decode the image (unsupported or corrupt file).")
+    if grayscale and scale < 1.0:
+        h, w = img.shape[:2]
+        img = cv2.resize(img, (max(int(w * scale), 1), max(int(h * scale), 1)), interpolation=cv2.INTER_AREA)
+    return fit_to_budget(img, max_pixels) if grayscale else img
+
+_NOISE_KERNEL = np.array([[1, -2, 1], [-2, 4, -2], [1, -2, 1]], dtype=np.float32)
+
+def estimate_noise(gray, buffers=None):
+    """
+    Fast noise estimate (Immerkaer, 1996): the mean absolute response of a
+    Laplacian-difference kernel, which cancels out image structure.
+    Returns the noise standard deviation in grey levels.
+    """
+    h, w = gray.shape[:2]
+    size = NOISE_SAMPLE_SIZE
+    top, left = max((h - size) // 2, 0), max((w - size) // 2, 0)
+    sample = gray[top:top + size, left:left + size]
+
+    # float32 output straight from the 8-bit crop, no converted copy
+    response = cv2.filter2D(sample, cv2.CV_32F, _NOISE_KERNEL, dst=_out(buffers, "noise", sample.shape[:2], np.float32))
+    response = response[1:-1, 1:-1]
+
+    sh, sw = response.shape[:2]
+    if sh == 0 or sw == 0:
+        return 0.0
+    return float(np.sqrt(np.pi / 2) * np.abs(response, out=response).sum() / (6.0 * sh * sw))
+
+def adaptive_denoise(gray, buffers=None):
+    """Skips clean scans, median-filters light grain, NL-means only for heavy noise"""
+    sigma = estimate_noise(gray, buffers)
+
+    if sigma < CLEAN_NOISE_SIGMA:
+        return gray
+    dst = _out(buffers, "denoised", gray.shape)
+    if sigma < HEAVY_NOISE_SIGMA:
+        return cv2.medianBlur(gray, 3, dst=dst)
+    # Smaller search window than the full pipeline: ~4x cheaper, same effect on text
+    return cv2.fastNlMeansDenoising(gray, dst, 10, 7, 11)
+
+def estimate_skew(binary, buffers=None):
+    """
+    Projection-profile skew estimate on a thumbnail.
+    Text lines give the sharpest horizontal row-sum profile when they are
+    level, so we try angles and keep the one with the highest profile variance.
+    Returns the rotation (degrees) that straightens the page.
+    """
+    h, w = binary.shape[:2]
+    scale = min(1.0, SKEW_SAMPLE_SIZE / max(h, w))
+    small = cv2.resize(binary, (max(int(w * scale), 1), max(int(h * scale), 1)), interpolation=cv2.INTER_AREA)
+
+    # Text is dark on a white page; count ink, not background
+    ink = cv2.bitwise_not(small, dst=small)
+    sh, sw = ink.shape[:2]
+    center = (sw // 2, sh // 2)
+    # Every trial rotation reuses one thumbnail-sized array
+    rotated = buffers.get("skew", (sh, sw)) if buffers is not None else np.empty((sh, sw), np.uint8)
+
+    def score(angle):
+        M = cv2.getRotationMatrix2D(center, angle, 1.0)
+        cv2.warpAffine(ink, M, (sw, sh), dst=rotated, flags=cv2.INTER_NEAREST, borderValue=0)
+        return float(np.var(rotated.sum(axis=1, dtype=np.float32)))
+
+    def sweep(angles):
+        # Ties go to the smallest rotation, so a flat profile stays at 0
+        scores = {float(angle): score(angle) for angle in angles}
+        return max(scores, key=lambda angle: (scores[angle], -abs(angle))), scores
+
+    # Coarse 1-degree sweep, then refine to 0.1 degree around the best
+    best, scores = sweep(np.arange(-MAX_SKEW_DEGREES, MAX_SKEW_DEGREES + 1, 1.0))
+    low, high = min(scores.values()), max(scores.values())
+    if high - low <= SKEW_MIN_CONTRAST * max(high, 1e-9):
+        # Blank / near-blank page: no angle is better than another
+        return 0.0
+    low_end, high_end = max(best - 1.0, -MAX_SKEW_DEGREES), min(best + 1.0, MAX_SKEW_DEGREES)
+    best, _ = sweep(np.round(np.arange(low_end, high_end + 0.01, 0.1), 1))
+    return round(float(best), 2) + 0.0   # never -0.0
+
+def preprocess_image(image_path, mode=None, buffers=None):
     """
     Stage 1: The Cleaner 
     Applies computer vision techniques to prepare the document for OCR.
+    Accepts a path, raw image bytes, or an in-memory array (e.g. a PDF page).
+    Pages over the memory budget are downscaled (or rejected, see PageTooLarge).
+    With `buffers` (page_buffers()) every stage writes into reused arrays and
+    the result is only valid until the next page is processed with them.
     
     Steps taken from Research Report:
     1. Grayscale Conversion
@@ -13,29 +256,58 @@ def preprocess_image(image_path):
     3. Binarization (High contrast Black & White)
     4. Deskewing (Straightening rotated images)
     """
+    mode = mode or PREPROCESS_MODE
     
-    # 1. Load the Image
-    if not os.path.exists(image_path):
-        raise FileNotFoundError(f"Image not found at: {image_path}")
-        
-    img = cv2.imread(image_path)
+    # 1. Load the Image (path, bytes or array), decoded straight to grayscale
+    img = load_image(image_path, grayscale=True)
     
     # 2. Convert to Grayscale
     # Color noise distracts the AI. We only need structure and text.
-    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-    
+    gray = img if img.ndim == 2 else cv2.cvtColor(img, cv2.COLOR_BGR2GRAY, dst=_out(buffers, "gray", img.shape[:2]))
+
+    if mode == "fast":
+        return _preprocess_fast(gray, buffers)
+    return _preprocess_full(gray, buffers)
+
+def _preprocess_fast(gray, buffers=None):
+    """
+    Same stages, cheaper: denoise only as much as the scan needs, estimate
+    skew on a thumbnail, and rotate the full-resolution page once.
+    """
+    denoised = adaptive_denoise(gray, buffers)
+    _, binary = cv2.threshold(denoised, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU,
+                              dst=_out(buffers, "binary", gray.shape))
+
+    angle = estimate_skew(binary, buffers)
+    if abs(angle) > 0.5:
+        (h, w) = binary.shape[:2]
+        M = cv2.getRotationMatrix2D((w // 2, h // 2), angle, 1.0)
+        logger.debug("🔄 Corrected skew by %.2f degrees.", angle)
+        return cv2.warpAffine(binary, M, (w, h), dst=_out(buffers, "rotated", (h, w)),
+                              flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE)
+
+    logger.debug("✅ Image is already straight.")
+    return binary
+
+def _preprocess_full(gray, buffers=None):
+    """The original full-resolution pipeline"""
     # 3. Denoise
     # Removes small "salt and pepper" noise from scanning/camera quality
-    denoised = cv2.fastNlMeansDenoising(gray, None, 10, 7, 21)
+    denoised = cv2.fastNlMeansDenoising(gray, _out(buffers, "denoised", gray.shape), 10, 7, 21)
     
     # 4. Binarization (Thresholding)
     # Turns the image strictly Black and White (no grey). 
     # This makes text pop out against the background.
-    _, binary = cv2.threshold(denoised, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    # In place: the denoised copy is not needed afterwards
+    _, binary = cv2.threshold(denoised, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU, dst=denoised)
     
     # 5. Deskewing (Rotation Correction)
     # If the user took a slanted photo, we calculate the angle and rotate it back.
-    coords = np.column_stack(np.where(binary > 0))
+    # findNonZero gives int32 (x, y) points: a quarter of the int64 index
+    # arrays np.where + column_stack build. Flipped to (row, col) as before.
+    points = cv2.findNonZero(binary)
+    coords = np.ascontiguousarray(points.reshape(-1, 2)[:, ::-1]) if points is not None else np.zeros((1, 2), np.int32)
+    del points
     angle = cv2.minAreaRect(coords)[-1]
     
     # Adjust angle format for OpenCV
@@ -49,12 +321,13 @@ def preprocess_image(image_path):
         (h, w) = binary.shape[:2]
         center = (w // 2, h // 2)
         M = cv2.getRotationMatrix2D(center, angle, 1.0)
-        rotated = cv2.warpAffine(binary, M, (w, h), flags=cv2.INTER_CUBIC, borderMode=cv2.BORDER_REPLICATE)
+        rotated = cv2.warpAffine(binary, M, (w, h), dst=_out(buffers, "rotated", (h, w)),
+                                 flags=cv2.INTER_CUBIC, borderMode=cv2.BORDER_REPLICATE)
         final_image = rotated
-        print(f"🔄 Corrected skew by {angle:.2f} degrees.")
+        logger.debug("🔄 Corrected skew by %.2f degrees.", angle)
     else:
         final_image = binary
-        print("✅ Image is already straight.")
+        logger.debug("✅ Image is already straight.")
 
     return final_image
 
@@ -71,6 +344,11 @@ if __name__ == "__main__":
         cv2.imwrite(test_path, blank_image)
         print("created temporary test image.")
 
+    # A blank page has a flat profile: it must not be rotated
+    blank_skew = estimate_skew(np.full((800, 600), 255, np.uint8))
+    print(f"Blank page skew: {blank_skew} (expected 0.0)")
+    assert blank_skew == 0.0
+
     try:
         processed = preprocess_image(test_path)
         print("Success! Preprocessing pipeline is working.")
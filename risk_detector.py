@@ -1,9 +1,119 @@
 import re
+import json
+import hashlib
+import logging
+from collections import namedtuple
+from functools import lru_cache
+
+# pyahocorasick is optional: without it the keywords are matched by one regex
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
+logger = logging.getLogger(__name__)
+
+# --- THE RULE TABLE ---
+# Per clause label, an ordered list of rules. A rule fires on keywords
+# (plain, case-insensitive substrings) and/or on the clause's number
+# (see NUMBER_EXTRACTORS) compared against a literal or a THRESHOLDS key.
+#   mode "first": like an if/elif chain, the first firing rule decides
+#   mode "all"  : every firing rule adds its reason; the last one sets the score
+RULES = {
+    # --- RULE 1: NOTICE PERIOD RISKS ---
+    "Notice": {
+        "mode": "first",
+        "rules": [
+            {"number": "days", "above": 0, "below": "notice_period_min", "score": 85,
+             "explanation": "Notice period of {value} days is too short (Standard: 30+ days)."},
+            {"keywords": ["waived", "immediate"], "score": 95,
+             "explanation": "Clause suggests Notice Period can be waived/immediate (High Risk)."},
+        ],
+    },
+    # --- RULE 2: SECURITY DEPOSIT RISKS ---
+    "Deposit": {
+        "mode": "first",
+        "rules": [
+            # A raw amount like 100000 can't be judged without the rent amount
+            {"keywords": ["rupees", "rs"], "score": 0,
+             "explanation": "Check if deposit amount > 3x monthly rent."},
+            {"number": "months", "above": "security_deposit_max", "score": 80,
+             "explanation": "Security deposit of {value} months is high (Standard: 2-3 months)."},
+            {"keywords": ["non-refundable"], "score": 100,
+             "explanation": "Deposit is marked as 'Non-Refundable'. This is illegal in many jurisdictions."},
+        ],
+    },
+    # --- RULE 3: INDEMNITY & LIABILITY ---
+    "Indemnity": {
+        "mode": "all",
+        "rules": [
+            {"keywords": ["all losses", "any damage"], "score": 75,
+             "explanation": "Broad indemnity clause: Makes you liable for 'all' damages, even accidental."},
+            {"keywords": ["tenant's cost"], "score": 60,
+             "explanation": "Forces tenant to pay for repairs that might be structural."},
+        ],
+    },
+    # --- RULE 4: TERMINATION ---
+    "Termination": {
+        "mode": "all",
+        "rules": [
+            {"keywords": ["at will", "without cause"], "score": 90,
+             "explanation": "Landlord can terminate 'at will' (Unstable tenancy)."},
+            {"keywords": ["forfeit"], "score": 80,
+             "explanation": "Clause mentions forfeiture of deposit on termination."},
+        ],
+    },
+}
+
+# Taxonomy labels (clause_taxonomy_v1.json) whose rules are filed under another name
+LABEL_ALIASES = {
+    "Notice Period": "Notice",
+}
+
+# The first number in the clause, optionally scaled when a unit keyword is present
+NUMBER_EXTRACTORS = {
+    "days": {"scale_if": {"month": 30}},   # "2 months" notice -> 60 days
+    "months": {"scale_if": {}},
+}
+
+# "Danger words" that force a rule check even when the classifier is unsure
+SAFETY_NET_WORDS = ['terminate', 'indemnify', 'increase', 'retain', 'evict', 'penalty']
+
+# The clause's number: the first run of digits
+NUMBER_PATTERN = re.compile(r"\d+")
+
+# Recent scans kept per detector: the cascade guard and assess_risks scan
+# the same clauses, so the second one is a lookup
+SCAN_CACHE_SIZE = 4096
+
+# What one pass over a clause yields: every keyword present + the first number
+Scan = namedtuple("Scan", ["keywords", "number"])
+
+
+def _trie_pattern(keywords):
+    """An alternation of `keywords` as a prefix trie: a(?:ll losses|t will)|..."""
+    trie = {}
+    for keyword in keywords:
+        node = trie
+        for char in keyword:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def build(node):
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        # A keyword ending here: the longer ones go first (greedy)
+        return f"(?:{body})?" if "" in node else body
+
+    return build(trie)
+
 
 class RiskDetector:
     def __init__(self):
-        print("⚖️  Risk Detector (The Judge) Initialized...")
-        
+        logger.info("⚖️  Risk Detector (The Judge) Initialized...")
+
         # Risk thresholds based on Indian Market Standards
         self.THRESHOLDS = {
             "notice_period_min": 30,      # Less than 30 days is risky
@@ -12,69 +122,130 @@ class RiskDetector:
             "rent_increase_max": 10       # More than 10% per year is risky
         }
 
+        self.RULES = RULES
+        self.SAFETY_NET_WORDS = frozenset(SAFETY_NET_WORDS)
+        self._compile()
+        self.scan = lru_cache(maxsize=SCAN_CACHE_SIZE)(self._scan)
+
+    def _compile(self):
+        """
+        Builds ONE matcher for every keyword of every rule (plus the safety
+        net words), so a clause is read once whatever the rule count:
+        an Aho-Corasick automaton if pyahocorasick is installed, else a
+        regex of the keywords as a prefix trie (at most one branch tried
+        per position, the longest keyword starting there wins).
+        """
+        keywords = set(self.SAFETY_NET_WORDS)
+        for table in self.RULES.values():
+            for rule in table["rules"]:
+                keywords.update(rule.get("keywords", []))
+        for extractor in NUMBER_EXTRACTORS.values():
+            keywords.update(extractor["scale_if"])
+        self._keywords = sorted(keywords, key=len, reverse=True)
+
+        if ahocorasick is not None:
+            # Reports every occurrence, overlapping ones included
+            self._automaton = ahocorasick.Automaton()
+            for keyword in keywords:
+                self._automaton.add_word(keyword, keyword)
+            self._automaton.make_automaton()
+            return
+
+        self._automaton = None
+        self._pattern = re.compile(_trie_pattern(keywords))
+        # Non-overlapping: a hit also means every keyword inside it...
+        self._implied = {kw: frozenset(other for other in keywords if other in kw) for kw in keywords}
+        # ...and a keyword overlapping its end may have been skipped: checked separately
+        self._overlaps = {
+            kw: frozenset(other for other in keywords if other not in kw and any(
+                kw.endswith(other[:n]) for n in range(1, min(len(kw), len(other)))
+            ))
+            for kw in keywords
+        }
+
+    def fingerprint(self):
+        """Identifies the active rule set; changes whenever a threshold or rule does"""
+        payload = json.dumps([self.THRESHOLDS, self.RULES, NUMBER_EXTRACTORS, LABEL_ALIASES], sort_keys=True)
+        return hashlib.sha256(payload.encode()).hexdigest()[:16]
+
+    def _scan(self, text):
+        """
+        One keyword pass over the clause, plus the first number.
+        `self.scan` is this behind an LRU cache.
+        """
+        number = NUMBER_PATTERN.search(text)
+        text = text.lower()
+
+        if self._automaton is not None:
+            found = {keyword for _, keyword in self._automaton.iter(text)}
+        else:
+            found = set()
+            hits = set(self._pattern.findall(text))
+            for hit in hits:
+                found |= self._implied[hit]
+            # Only a keyword overlapping the end of a hit can have been skipped
+            for other in set().union(*(self._overlaps[hit] for hit in hits)) - found:
+                if other in text:
+                    found.add(other)
+
+        return Scan(frozenset(found), float(number.group()) if number is not None else 0)
+
+    def needs_safety_net(self, scan):
+        """True if the clause contains any of the danger words"""
+        return not self.SAFETY_NET_WORDS.isdisjoint(scan.keywords)
+
     def extract_number(self, text):
         """Helper to find numbers (like '2 months', '10%') in text"""
         # Finds digits, even if they are like "two" or "2" (simplified for now to digits)
-        matches = re.findall(r'\d+', text)
-        if matches:
-            return float(matches[0])
-        return 0
+        return self.scan(text).number
+
+    def _number(self, name, scan):
+        value = scan.number
+        for keyword, factor in NUMBER_EXTRACTORS[name]["scale_if"].items():
+            if keyword in scan.keywords:
+                value = value * factor
+        return value
+
+    def _threshold(self, value):
+        return self.THRESHOLDS[value] if isinstance(value, str) else value
+
+    def _fires(self, rule, scan):
+        """Returns (fired, number) for one rule against a scanned clause"""
+        if "keywords" in rule and scan.keywords.isdisjoint(rule["keywords"]):
+            return False, None
 
-    def analyze_risk(self, label, text):
+        value = None
+        if "number" in rule:
+            value = self._number(rule["number"], scan)
+            if "above" in rule and not value > self._threshold(rule["above"]):
+                return False, value
+            if "below" in rule and not value < self._threshold(rule["below"]):
+                return False, value
+
+        return True, value
+
+    def analyze_risk(self, label, text, scan=None):
         """
         Input: Clause Label (e.g. 'Notice'), Clause Text
         Output: Risk Score (0-100), Level, Explanation
         """
-        text_lower = text.lower()
+        if scan is None:
+            scan = self.scan(text)
+
         risk_score = 0
         reasons = []
-        
-        # --- RULE 1: NOTICE PERIOD RISKS  ---
-        if label == "Notice":
-            days = self.extract_number(text)
-            # If identified as months, convert to days
-            if "month" in text_lower:
-                days = days * 30
-                
-            if 0 < days < self.THRESHOLDS["notice_period_min"]:
-                risk_score = 85
-                reasons.append(f"Notice period of {int(days)} days is too short (Standard: 30+ days).")
-            elif "waived" in text_lower or "immediate" in text_lower:
-                risk_score = 95
-                reasons.append("Clause suggests Notice Period can be waived/immediate (High Risk).")
-            else:
-                reasons.append("Notice period appears standard.")
-
-        # --- RULE 2: SECURITY DEPOSIT RISKS  ---
-        elif label == "Deposit":
-            months = self.extract_number(text)
-            if "rupees" in text_lower or "rs" in text_lower:
-                # If it's a raw number like 100000, we can't judge without rent amount.
-                reasons.append("Check if deposit amount > 3x monthly rent.")
-            elif months > self.THRESHOLDS["security_deposit_max"]:
-                risk_score = 80
-                reasons.append(f"Security deposit of {int(months)} months is high (Standard: 2-3 months).")
-            elif "non-refundable" in text_lower:
-                risk_score = 100
-                reasons.append("Deposit is marked as 'Non-Refundable'. This is illegal in many jurisdictions.")
-
-        # --- RULE 3: INDEMNITY & LIABILITY  ---
-        elif label == "Indemnity":
-            if "all losses" in text_lower or "any damage" in text_lower:
-                risk_score = 75
-                reasons.append("Broad indemnity clause: Makes you liable for 'all' damages, even accidental.")
-            if "tenant's cost" in text_lower:
-                risk_score = 60
-                reasons.append("Forces tenant to pay for repairs that might be structural.")
-
-        # --- RULE 4: TERMINATION  ---
-        elif label == "Termination":
-            if "at will" in text_lower or "without cause" in text_lower:
-                risk_score = 90
-                reasons.append("Landlord can terminate 'at will' (Unstable tenancy).")
-            if "forfeit" in text_lower:
-                risk_score = 80
-                reasons.append("Clause mentions forfeiture of deposit on termination.")
+
+        table = self.RULES.get(LABEL_ALIASES.get(label, label))
+        if table is not None:
+            for rule in table["rules"]:
+                fired, value = self._fires(rule, scan)
+                if not fired:
+                    continue
+
+                risk_score = rule["score"]
+                reasons.append(rule["explanation"].format(value=int(value) if value is not None else ""))
+                if table["mode"] == "first":
+                    break
 
         # --- DEFAULT LOW RISK ---
         if risk_score == 0:
@@ -84,21 +255,35 @@ class RiskDetector:
         else:
             return {"score": risk_score, "level": "High Risk", "explanation": " ".join(reasons)}
 
+    def analyze_batch(self, labels, texts, scans=None):
+        """
+        Evaluates a whole document at once. `labels[i]` may be None to skip
+        a clause (its result is None). Pass `scans` from scan() to avoid
+        scanning the same clauses twice.
+        """
+        if scans is None:
+            scans = [self.scan(text) if label is not None else None for label, text in zip(labels, texts)]
+
+        return [
+            self.analyze_risk(label, text, scan) if label is not None else None
+            for label, text, scan in zip(labels, texts, scans)
+        ]
+
 # --- TEST BLOCK ---
 if __name__ == "__main__":
     judge = RiskDetector()
-    
+
     test_cases = [
         ("Notice", "The tenant must provide 7 days notice before leaving."),
         ("Deposit", "A security deposit of 6 months rent is required."),
         ("Termination", "Landlord can terminate this lease at will without reason."),
         ("Notice", "30 days written notice is required.")
     ]
-    
+
     print("\n--- ⚖️  JUDGEMENT DAY ---")
     for lbl, txt in test_cases:
         result = judge.analyze_risk(lbl, txt)
         print(f"\nClause: {lbl}")
         print(f"Text: {txt}")
         print(f"Verdict: {result['level']} (Score: {result['score']})")
-        print(f"Reason: {result['explanation']}")
\ No newline at end of file
+        print(f"Reason: {result['explanation']}")
@@ -0,0 +1,130 @@
+import re
+
+# Granularity rules from text_granularity_v1.md
+MIN_CLAUSE_CHARS = 50
+
+# A new clause starts on a line that opens with a clause number or a recital
+# keyword: "7.2", "7.", "12)", "(a)", "b)", "(iv)", "WHEREAS", "Article 3" ...
+CLAUSE_START = re.compile(
+    r'^(?:'
+    r'\d+(?:\.\d+)+\.?'                       # 7.2 / 7.2.1 / 7.2.
+    r'|\d+[.)]'                               # 7. / 7)
+    r'|\(?[a-z]\)'                            # (a) / a)
+    r'|\([ivxlc]+\)'                          # (iv)
+    r'|WHEREAS|NOW,?\s+THEREFORE'             # recitals
+    r'|(?:ARTICLE|SECTION|CLAUSE|SCHEDULE)\s+[\dIVXLC]+'
+    r')(?=\s|$)',
+    re.IGNORECASE,
+)
+
+# A vertical gap this many line-heights tall is treated as a paragraph break,
+# even if Tesseract put both lines into the same paragraph.
+PARAGRAPH_GAP_RATIO = 1.5
+
+
+def _union(boxes):
+    """Smallest (left, top, right, bottom) box covering all boxes"""
+    return (
+        min(b[0] for b in boxes),
+        min(b[1] for b in boxes),
+        max(b[2] for b in boxes),
+        max(b[3] for b in boxes),
+    )
+
+
+def _group_lines(words):
+    """
+    Stage 1: Words -> Lines
+    Uses Tesseract's own page/block/paragraph/line numbering.
+    """
+    lines = []
+    current_key = None
+
+    for word in words:
+        key = (word["page"], word["block"], word["par"], word["line"])
+        if key != current_key:
+            lines.append({"key": key, "words": []})
+            current_key = key
+        lines[-1]["words"].append(word)
+
+    for line in lines:
+        line["text"] = " ".join(w["text"] for w in line["words"])
+        line["bbox"] = _union([w["bbox"] for w in line["words"]])
+
+    return lines
+
+
+def _is_paragraph_break(prev, line):
+    """True if `line` cannot continue the paragraph that `prev` belongs to"""
+    # Different page, block or paragraph according to Tesseract
+    if prev["key"][:3] != line["key"][:3]:
+        return True
+
+    # Large vertical whitespace inside one Tesseract paragraph
+    height = max(prev["bbox"][3] - prev["bbox"][1], 1)
+    gap = line["bbox"][1] - prev["bbox"][3]
+    return gap > PARAGRAPH_GAP_RATIO * height
+
+
+def _flush_tail(merged, pending):
+    """A short tail sticks to the previous clause if it is on the same page"""
+    if merged and merged[-1][0]["key"][0] == pending[0]["key"][0]:
+        merged[-1].extend(pending)
+    else:
+        merged.append(pending)
+
+
+def _make_unit(lines):
+    words = [w for line in lines for w in line["words"]]
+    return {
+        "text": " ".join(line["text"] for line in lines),
+        "confidence": round(sum(w["confidence"] for w in words) / len(words), 2),
+        "page": lines[0]["key"][0],
+        "bbox": _union([line["bbox"] for line in lines]),
+    }
+
+
+def segment_clauses(words, min_chars=MIN_CLAUSE_CHARS):
+    """
+    Stage 2: The Segmenter
+    Rebuilds clause-sized units out of word-level OCR output.
+
+    Steps:
+    1. Group words into lines (Tesseract block/par/line numbers)
+    2. Split lines into paragraphs (layout breaks + clause numbering)
+    3. Merge fragments shorter than `min_chars` into their neighbour
+       (a heading like "7. RENT" joins the clause that follows it)
+
+    Returns a list of {"text", "confidence", "page", "bbox"} dicts.
+    """
+    lines = _group_lines(words)
+    if not lines:
+        return []
+
+    # 2. Lines -> Paragraphs / Clauses
+    groups = [[lines[0]]]
+    for prev, line in zip(lines, lines[1:]):
+        if _is_paragraph_break(prev, line) or CLAUSE_START.match(line["text"]):
+            groups.append([])
+        groups[-1].append(line)
+
+    # 3. Merge short fragments forward, within the same page.
+    # The joined length is kept as a running count (text + one space per
+    # line), so long runs of short lines don't re-join the text every time.
+    merged = []
+    pending = []
+    pending_chars = -1
+    for group in groups:
+        if pending and pending[0]["key"][0] != group[0]["key"][0]:
+            _flush_tail(merged, pending)
+            pending, pending_chars = [], -1
+        pending.extend(group)
+        pending_chars += sum(len(line["text"]) + 1 for line in group)
+        if pending_chars >= min_chars:
+            merged.append(pending)
+            pending, pending_chars = [], -1
+
+    if pending:
+        _flush_tail(merged, pending)
+
+    return [_make_unit(group) for group in merged]
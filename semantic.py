@@ -0,0 +1,208 @@
+import hashlib
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import cache
+
+logger = logging.getLogger(__name__)
+
+# --- CONFIGURATION ---
+# Any SBERT-style encoder (mean pooling over tokens): a local directory or a hub id
+MODEL_NAME = os.environ.get("LEGALLENS_SEMANTIC_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+# On by default only for an encoder already on disk, so startup never
+# downloads from the hub. LEGALLENS_SEMANTIC=1 / 0 forces it on / off.
+ENABLED = os.environ.get("LEGALLENS_SEMANTIC", "1" if os.path.isdir(MODEL_NAME) else "0") == "1"
+EXEMPLARS_PATH = os.environ.get("LEGALLENS_EXEMPLARS", "risk_exemplars_v1.json")
+# On-disk storage of the exemplar matrix: "float32" or "int8" (4x smaller)
+INDEX_DTYPE = os.environ.get("LEGALLENS_SEMANTIC_DTYPE", "float32")
+INDEX_DIR = os.path.join(cache.CACHE_DIR, "semantic")
+
+# Cosine similarity from which the nearest risky exemplar counts as a match
+MATCH_THRESHOLD = float(os.environ.get("LEGALLENS_SEMANTIC_THRESHOLD", 0.75))
+TOP_K = 3
+MAX_LENGTH = 256
+MAX_BATCH_TOKENS = 8192
+
+STANDARD = "Standard"
+MODEL_SOURCE = "SBERT Anomaly Detector"
+
+
+class Encoder:
+    """
+    Sentence embeddings the SBERT way: mean of the token vectors,
+    L2-normalised, so a dot product is a cosine similarity.
+    Batches are length-sorted and dynamically padded like ClauseClassifier.
+    """
+
+    def __init__(self, model_name=MODEL_NAME):
+        from transformers import AutoModel, AutoTokenizer
+
+        self.model_name = model_name
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+        self.model = AutoModel.from_pretrained(model_name)
+        self.model.eval()
+
+    def encode(self, texts, max_batch_tokens=MAX_BATCH_TOKENS):
+        import torch
+
+        encodings = self.tokenizer(list(texts), truncation=True, max_length=MAX_LENGTH)
+        lengths = [len(ids) for ids in encodings["input_ids"]]
+        order = sorted(range(len(texts)), key=lambda i: lengths[i])
+        vectors = [None] * len(texts)
+
+        batches, batch = [], []
+        for i in order:
+            if batch and lengths[i] * (len(batch) + 1) > max_batch_tokens:
+                batches.append(batch)
+                batch = []
+            batch.append(i)
+        if batch:
+            batches.append(batch)
+
+        for batch in batches:
+            features = [{key: encodings[key][i] for key in encodings.keys()} for i in batch]
+            inputs = self.tokenizer.pad(features, return_tensors="pt")
+            with torch.inference_mode():
+                tokens = self.model(**inputs).last_hidden_state
+            mask = inputs["attention_mask"].unsqueeze(-1).to(tokens.dtype)
+            pooled = (tokens * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1e-9)
+            pooled = torch.nn.functional.normalize(pooled, dim=-1).float().numpy()
+            for i, row in zip(batch, pooled):
+                vectors[i] = row
+
+        return np.stack(vectors).astype(np.float32, copy=False)
+
+
+def load_exemplars(path=EXEMPLARS_PATH):
+    """The exemplar library: a JSON file with an "exemplars" list, or JSONL"""
+    with open(path, "rb") as f:
+        raw = f.read()
+    if path.endswith(".jsonl"):
+        exemplars = [json.loads(line) for line in raw.decode().splitlines() if line.strip()]
+    else:
+        exemplars = json.loads(raw)["exemplars"]
+    return exemplars, hashlib.sha256(raw).hexdigest()
+
+
+def quantize(matrix):
+    """Symmetric per-row int8: row ~= q * scale"""
+    scales = np.abs(matrix).max(axis=1, keepdims=True) / 127.0
+    scales[scales == 0] = 1.0
+    return np.round(matrix / scales).astype(np.int8), scales.astype(np.float32)
+
+
+class SemanticMatcher:
+    """
+    Nearest-exemplar risk matching.
+
+    The exemplar library is embedded once and persisted under the cache
+    directory (keyed by library contents, encoder and dtype), so restarts
+    only load a matrix. Scoring a document is one encoder pass over its
+    clauses plus one (clauses x exemplars) matrix multiply.
+    Every pass runs on the matcher's own thread, one at a time: torch
+    already uses all cores per pass, so concurrent callers only queue.
+    """
+
+    def __init__(self, encoder=None, exemplars_path=EXEMPLARS_PATH, dtype=INDEX_DTYPE):
+        if dtype not in ("float32", "int8"):
+            raise ValueError(f"Unknown index dtype '{dtype}'. Choose float32 or int8.")
+
+        self.encoder = encoder or Encoder()
+        self.exemplars, library_hash = load_exemplars(exemplars_path)
+        self.index_version = hashlib.sha256(
+            f"{library_hash}|{self.encoder.model_name}|{dtype}".encode()
+        ).hexdigest()[:16]
+        # Verdicts also depend on the match threshold (cf. the cascade's version)
+        self.version = f"{self.index_version}-{MATCH_THRESHOLD:g}"
+        self.matrix = self._load_index(dtype)
+        self._thread = ThreadPoolExecutor(max_workers=1, thread_name_prefix="semantic")
+
+    def fingerprint(self):
+        return self.version
+
+    def _load_index(self, dtype):
+        path = os.path.join(INDEX_DIR, f"{self.index_version}.npz")
+        if os.path.exists(path):
+            stored = np.load(path)
+            if "scales" in stored:
+                return stored["vectors"].astype(np.float32) * stored["scales"]
+            return stored["vectors"]
+
+        logger.info("🧮 Embedding %d risk exemplars...", len(self.exemplars))
+        matrix = self.encoder.encode([e["text"] for e in self.exemplars])
+
+        os.makedirs(INDEX_DIR, exist_ok=True)
+        if dtype == "int8":
+            vectors, scales = quantize(matrix)
+            np.savez(path, vectors=vectors, scales=scales)
+            return vectors.astype(np.float32) * scales
+        np.savez(path, vectors=matrix)
+        return matrix
+
+    def submit(self, texts, k=TOP_K):
+        """match() on the matcher's thread; returns a concurrent.futures.Future"""
+        return self._thread.submit(self._match, list(texts), k)
+
+    def match(self, texts, k=TOP_K):
+        """
+        The `k` most similar exemplars for every text, best first:
+        lists of {"text", "label", "risk", "score", "explanation", "similarity"}.
+        """
+        return self.submit(texts, k).result()
+
+    def _match(self, texts, k):
+        if not texts:
+            return []
+
+        sims = self.encoder.encode(texts) @ self.matrix.T
+        k = min(k, sims.shape[1])
+        top = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+
+        results = []
+        for row, candidates in zip(sims, top):
+            ranked = candidates[np.argsort(-row[candidates])]
+            results.append([
+                {
+                    "text": self.exemplars[j]["text"],
+                    "label": self.exemplars[j]["label"],
+                    "risk": self.exemplars[j]["risk"],
+                    "score": self.exemplars[j]["score"],
+                    "explanation": self.exemplars[j].get("explanation", ""),
+                    "similarity": round(float(row[j]), 4),
+                }
+                for j in ranked
+            ])
+        return results
+
+
+def verdict(matches, threshold=MATCH_THRESHOLD):
+    """The nearest exemplar if it is a risky one and close enough, else None"""
+    if matches and matches[0]["risk"] != STANDARD and matches[0]["similarity"] >= threshold:
+        return matches[0]
+    return None
+
+
+def load():
+    """The matcher, or None when disabled or the encoder cannot be loaded"""
+    if not ENABLED:
+        return None
+    try:
+        return SemanticMatcher()
+    except Exception as e:
+        logger.warning("⚠️ Semantic risk matching unavailable (%s). Using keyword rules only.", e)
+        return None
+
+# --- TEST BLOCK ---
+if __name__ == "__main__":
+    matcher = SemanticMatcher()
+
+    test_text = "Landlord reserves the right to hike the rent by 25 percent every year at his discretion."
+    matches = matcher.match([test_text])[0]
+    print(f"\nText: {test_text}")
+    for m in matches:
+        print(f"  {m['similarity']:.3f}  [{m['risk']}] {m['text']}")
+    print(f"Verdict: {verdict(matches)}")
@@ -0,0 +1,109 @@
+import io
+import re
+
+# pdfminer is optional: without it every page simply goes through OCR
+try:
+    from pdfminer.high_level import extract_pages
+    from pdfminer.layout import LAParams, LTChar, LTTextContainer, LTTextLine
+except ImportError:
+    extract_pages = None
+
+# A page needs at least this much real text to skip OCR
+MIN_PAGE_CHARS = 40
+# Share of letters/digits/spaces/punctuation among the extracted characters.
+# Broken font encodings produce "(cid:12)" runs or private-use glyphs.
+MIN_CLEAN_RATIO = 0.85
+
+CID_PATTERN = re.compile(r'\(cid:\d+\)')
+CLEAN_CHAR = re.compile(r'[\w\s.,;:()\'"%&/\-₹$]')
+
+
+def is_available():
+    return extract_pages is not None
+
+
+def is_usable(words):
+    """
+    Decides if a page's text layer can be trusted or must be OCR'd.
+    Scanned PDFs have no text layer; some digital PDFs have a garbage one.
+    """
+    text = " ".join(w["text"] for w in words)
+    if len(text) < MIN_PAGE_CHARS:
+        return False
+    if CID_PATTERN.search(text):
+        return False
+
+    clean = sum(1 for ch in text if CLEAN_CHAR.match(ch))
+    return clean / len(text) >= MIN_CLEAN_RATIO
+
+
+def _line_words(line, page_height, scale):
+    """
+    Splits a pdfminer text line into words with pixel boxes.
+    Boxes use the same top-left origin and DPI as the OCR output.
+    """
+    words = []
+    chars = []
+
+    def flush():
+        if chars:
+            x0 = min(c.x0 for c in chars)
+            x1 = max(c.x1 for c in chars)
+            y0 = min(c.y0 for c in chars)
+            y1 = max(c.y1 for c in chars)
+            words.append({
+                "text": "".join(c.get_text() for c in chars),
+                "bbox": (
+                    int(x0 * scale), int((page_height - y1) * scale),
+                    int(x1 * scale), int((page_height - y0) * scale)
+                )
+            })
+            chars.clear()
+
+    for obj in line:
+        if isinstance(obj, LTChar) and not obj.get_text().isspace():
+            chars.append(obj)
+        else:
+            flush()
+    flush()
+
+    return words
+
+
+def iter_pdf_words(file_path, dpi=300):
+    """
+    Yields one word list per PDF page, read from the embedded text layer.
+    `file_path` may be a path or the PDF's bytes.
+    Word dicts match ocr_engine.ocr_image: text, confidence, page,
+    block, par, line and bbox (in pixels at `dpi`).
+    """
+    scale = dpi / 72.0
+    if isinstance(file_path, (bytes, bytearray)):
+        file_path = io.BytesIO(file_path)
+
+    for page_index, page in enumerate(extract_pages(file_path, laparams=LAParams())):
+        words = []
+        block_num = 0
+
+        for element in page:
+            if not isinstance(element, LTTextContainer):
+                continue
+            block_num += 1
+
+            line_num = 0
+            for line in element:
+                if not isinstance(line, LTTextLine):
+                    continue
+                line_num += 1
+
+                for word in _line_words(line, page.height, scale):
+                    word.update({
+                        "confidence": 100,
+                        "page": page_index,
+                        "block": block_num,
+                        "par": 1,
+                        "line": line_num,
+                    })
+                    words.append(word)
+
+        yield words
@@ -1,133 +1,428 @@
-import torch
-from transformers import AutoTokenizer, AutoModelForSequenceClassification, Trainer, TrainingArguments
-from torch.utils.data import Dataset
+import argparse
+import csv
+import json
 import os
+import random
 import shutil
+from collections import defaultdict
+
+import numpy as np
+import torch
+from torch.utils.data import Dataset
+from transformers import (
+    AutoModelForSequenceClassification,
+    AutoTokenizer,
+    DataCollatorWithPadding,
+    Trainer,
+    TrainingArguments,
+)
+
+import cascade
+from risk_detector import RiskDetector
 
 # --- CONFIGURATION ---
 MODEL_NAME = "law-ai/InLegalBERT"
 OUTPUT_DIR = "./saved_models/clause_model"
+TAXONOMY_PATH = "clause_taxonomy_v1.json"
+
+# text_granularity_v1.md: a clause is at most 512 tokens
+MAX_LENGTH = 512
+# data_split_strategy_v1.md: stratified 70 / 15 / 15
+SPLIT_RATIOS = {"train": 0.70, "validation": 0.15, "test": 0.15}
+# Tokens per forward pass when caching encoder features (--frozen)
+FEATURE_BATCH_TOKENS = 8192
 
 # --- THE DATASET (50+ Curated Examples) ---
 # We use this list to guarantee the script runs without needing external CSV files.
+# Labels are clause_taxonomy_v1.json names. Real corpora come in via --data.
 train_data = [
-    # 0: TERMINATION
-    ("The landlord may terminate this agreement with 30 days notice.", 0),
-    ("This lease shall determine absolutely upon the expiry of the term.", 0),
-    ("Either party can cancel this contract for breach of terms.", 0),
-    ("The agreement will automatically end if rent is unpaid for 2 months.", 0),
-    ("Lessor reserves the right to evict the lessee for illegal activities.", 0),
-    ("Upon termination, the tenant must vacate the premises immediately.", 0),
-    ("This contract is valid for 11 months and ends thereafter.", 0),
-    ("Premature termination attracts a penalty of two months' rent.", 0),
-    ("The owner has the right to rescind this contract at will.", 0),
-    ("Termination of services requires a formal written letter.", 0),
-    ("The lease terminates automatically on 31st March.", 0),
-    ("Failure to comply with rules results in immediate cancellation.", 0),
-
-    # 1: RENT & PAYMENT
-    ("The monthly rent shall be INR 25,000 payable in advance.", 1),
-    ("Tenant agrees to pay the rent via bank transfer by the 5th.", 1),
-    ("Failure to pay rent may attract a penalty of 18%.", 1),
-    ("The Licensee shall pay the Licensor a monthly fee of Rs 10,000.", 1),
-    ("Rent is subject to a 5% escalation every year.", 1),
-    ("All payments must be made via NEFT or RTGS only.", 1),
-    ("Cheques should be made payable to the Landlord.", 1),
-    ("Any delay in payment will incur a late fee of Rs 500 per day.", 1),
-    ("The rent excludes electricity and water maintenance charges.", 1),
-    ("Base rent is fixed for the first two years of the tenure.", 1),
-    ("The lessee must pay rent on or before the 10th of each month.", 1),
-
-    # 2: INDEMNITY & LIABILITY
-    ("Tenant shall indemnify the Landlord against all losses and damages.", 2),
-    ("The Landlord is not liable for theft or damage to Tenant's property.", 2),
-    ("The Lessee agrees to hold the Lessor harmless from any claims.", 2),
-    ("Any structural damage caused by the tenant must be reimbursed.", 2),
-    ("The owner is not responsible for fire or natural calamities.", 2),
-    ("Tenant takes full responsibility for any accidents on the premises.", 2),
-    ("Indemnification covers all legal costs incurred by the owner.", 2),
-    ("The tenant is liable for damages to fixtures and furniture.", 2),
-    ("Lessor is not accountable for third-party disputes.", 2),
-    ("The occupant assumes all risk associated with the property.", 2),
-
-    # 3: NOTICE PERIOD
-    ("A written notice of three months is required for early exit.", 3),
-    ("The lock-in period is 12 months; no notice allowed during this time.", 3),
-    ("Either party must serve a 60-day notice prior to vacating.", 3),
-    ("Failure to serve notice will result in forfeiture of deposit.", 3),
-    ("Notice period is waived if the building is deemed unsafe.", 3),
-    ("One month notice is mandatory for lease renewal.", 3),
-    ("The tenant must inform the landlord 30 days in advance.", 3),
-    ("Short notice periods are not accepted under this agreement.", 3),
-    ("Notice must be sent via Registered Post with Acknowledgement Due.", 3),
-    ("The notice period commences from the 1st of the subsequent month.", 3),
-
-    # 4: SECURITY DEPOSIT
-    ("A security deposit equivalent to 6 months rent is required.", 4),
-    ("The deposit will be refunded interest-free after vacating.", 4),
-    ("Landlord may deduct repair costs from the security deposit.", 4),
-    ("The advance amount is fully refundable upon handover of keys.", 4),
-    ("Security deposit cannot be adjusted against the last month's rent.", 4),
-    ("The tenant has paid Rs 1,00,000 as an interest-free security deposit.", 4),
-    ("Deductions for painting will be made from the deposit.", 4),
-    ("The balance of the deposit shall be returned within 15 days.", 4),
-    ("No interest is payable on the security amount held by the owner.", 4),
-    ("The deposit serves as security for the due performance of terms.", 4)
+    # TERMINATION
+    ("The landlord may terminate this agreement with 30 days notice.", "Termination"),
+    ("This lease shall determine absolutely upon the expiry of the term.", "Termination"),
+    ("Either party can cancel this contract for breach of terms.", "Termination"),
+    ("The agreement will automatically end if rent is unpaid for 2 months.", "Termination"),
+    ("Lessor reserves the right to evict the lessee for illegal activities.", "Termination"),
+    ("Upon termination, the tenant must vacate the premises immediately.", "Termination"),
+    ("This contract is valid for 11 months and ends thereafter.", "Termination"),
+    ("Premature termination attracts a penalty of two months' rent.", "Termination"),
+    ("The owner has the right to rescind this contract at will.", "Termination"),
+    ("Termination of services requires a formal written letter.", "Termination"),
+    ("The lease terminates automatically on 31st March.", "Termination"),
+    ("Failure to comply with rules results in immediate cancellation.", "Termination"),
+
+    # RENT & PAYMENT (routine payment terms are "Other" in the taxonomy)
+    ("The monthly rent shall be INR 25,000 payable in advance.", "Other"),
+    ("Tenant agrees to pay the rent via bank transfer by the 5th.", "Other"),
+    ("Failure to pay rent may attract a penalty of 18%.", "Other"),
+    ("The Licensee shall pay the Licensor a monthly fee of Rs 10,000.", "Other"),
+    ("Rent is subject to a 5% escalation every year.", "Rent Increase"),
+    ("All payments must be made via NEFT or RTGS only.", "Other"),
+    ("Cheques should be made payable to the Landlord.", "Other"),
+    ("Any delay in payment will incur a late fee of Rs 500 per day.", "Other"),
+    ("The rent excludes electricity and water maintenance charges.", "Other"),
+    ("Base rent is fixed for the first two years of the tenure.", "Rent Increase"),
+    ("The lessee must pay rent on or before the 10th of each month.", "Other"),
+
+    # INDEMNITY & LIABILITY
+    ("Tenant shall indemnify the Landlord against all losses and damages.", "Indemnity"),
+    ("The Landlord is not liable for theft or damage to Tenant's property.", "Indemnity"),
+    ("The Lessee agrees to hold the Lessor harmless from any claims.", "Indemnity"),
+    ("Any structural damage caused by the tenant must be reimbursed.", "Indemnity"),
+    ("The owner is not responsible for fire or natural calamities.", "Indemnity"),
+    ("Tenant takes full responsibility for any accidents on the premises.", "Indemnity"),
+    ("Indemnification covers all legal costs incurred by the owner.", "Indemnity"),
+    ("The tenant is liable for damages to fixtures and furniture.", "Indemnity"),
+    ("Lessor is not accountable for third-party disputes.", "Indemnity"),
+    ("The occupant assumes all risk associated with the property.", "Indemnity"),
+
+    # NOTICE PERIOD
+    ("A written notice of three months is required for early exit.", "Notice Period"),
+    ("The lock-in period is 12 months; no notice allowed during this time.", "Notice Period"),
+    ("Either party must serve a 60-day notice prior to vacating.", "Notice Period"),
+    ("Failure to serve notice will result in forfeiture of deposit.", "Notice Period"),
+    ("Notice period is waived if the building is deemed unsafe.", "Notice Period"),
+    ("One month notice is mandatory for lease renewal.", "Notice Period"),
+    ("The tenant must inform the landlord 30 days in advance.", "Notice Period"),
+    ("Short notice periods are not accepted under this agreement.", "Notice Period"),
+    ("Notice must be sent via Registered Post with Acknowledgement Due.", "Notice Period"),
+    ("The notice period commences from the 1st of the subsequent month.", "Notice Period"),
+
+    # SECURITY DEPOSIT
+    ("A security deposit equivalent to 6 months rent is required.", "Deposit"),
+    ("The deposit will be refunded interest-free after vacating.", "Deposit"),
+    ("Landlord may deduct repair costs from the security deposit.", "Deposit"),
+    ("The advance amount is fully refundable upon handover of keys.", "Deposit"),
+    ("Security deposit cannot be adjusted against the last month's rent.", "Deposit"),
+    ("The tenant has paid Rs 1,00,000 as an interest-free security deposit.", "Deposit"),
+    ("Deductions for painting will be made from the deposit.", "Deposit"),
+    ("The balance of the deposit shall be returned within 15 days.", "Deposit"),
+    ("No interest is payable on the security amount held by the owner.", "Deposit"),
+    ("The deposit serves as security for the due performance of terms.", "Deposit")
 ]
 
+
+# --- 1. LABELS & DATA ---
+
+def load_taxonomy(path=TAXONOMY_PATH):
+    """The label set; its order fixes the class ids saved in the model config"""
+    with open(path) as f:
+        taxonomy = json.load(f)
+    labels = taxonomy["labels"]
+    return taxonomy, {i: label for i, label in enumerate(labels)}, {label: i for i, label in enumerate(labels)}
+
+
+def read_examples(path):
+    """
+    Labeled clauses from JSONL ({"text", "label"[, "split"]} per line) or
+    CSV (text,label[,split] columns). `label` is a taxonomy name.
+    """
+    if path.endswith(".jsonl"):
+        with open(path, encoding="utf-8") as f:
+            rows = [json.loads(line) for line in f if line.strip()]
+    elif path.endswith(".csv"):
+        with open(path, encoding="utf-8", newline="") as f:
+            rows = list(csv.DictReader(f))
+    else:
+        raise ValueError(f"Unsupported data file '{path}'. Use .jsonl or .csv.")
+
+    return [
+        {"text": row["text"], "label": str(row["label"]).strip(), "split": row.get("split") or None}
+        for row in rows
+    ]
+
+
+def clean_examples(examples, label2id):
+    """
+    Cleaning + deduplication, before any split (data_split_strategy_v1.md).
+    Duplicates are judged on the normalized text, so a clause that differs
+    only in numbering or spacing cannot end up in both train and test.
+    """
+    from clause_cache import normalize
+
+    unknown = sorted({e["label"] for e in examples} - set(label2id))
+    if unknown:
+        raise ValueError(f"Labels not in the taxonomy: {unknown}")
+
+    seen = set()
+    cleaned = []
+    for example in examples:
+        text = " ".join(example["text"].split())
+        key = normalize(text)
+        if len(key) < 5 or key in seen:
+            continue
+        seen.add(key)
+        cleaned.append({**example, "text": text})
+
+    return cleaned
+
+
+def split_examples(examples, seed=42):
+    """
+    Stratified by label (data_split_strategy_v1.md). Rows that already
+    carry a split keep it; the rest are divided per label by SPLIT_RATIOS.
+    """
+    rng = random.Random(seed)
+    splits = {name: [] for name in SPLIT_RATIOS}
+    by_label = defaultdict(list)
+
+    for example in examples:
+        if example["split"] in splits:
+            splits[example["split"]].append(example)
+        else:
+            by_label[example["label"]].append(example)
+
+    for label in sorted(by_label):
+        group = by_label[label]
+        rng.shuffle(group)
+        n_val = round(len(group) * SPLIT_RATIOS["validation"])
+        n_test = round(len(group) * SPLIT_RATIOS["test"])
+        # Tiny classes: training gets priority
+        if len(group) - n_val - n_test < 1:
+            n_val = n_test = 0
+        splits["validation"].extend(group[:n_val])
+        splits["test"].extend(group[n_val:n_val + n_test])
+        splits["train"].extend(group[n_val + n_test:])
+
+    return splits
+
+
 class LegalDataset(Dataset):
-    def __init__(self, data, tokenizer):
-        self.encodings = tokenizer([d[0] for d in data], truncation=True, padding=True, max_length=128)
-        self.labels = [d[1] for d in data]
+    """
+    Tokenized once, unpadded: the collator pads each batch to its own
+    longest member, and length-grouped sampling keeps batches homogeneous.
+    """
+
+    def __init__(self, data, tokenizer, label2id, max_length=MAX_LENGTH):
+        self.encodings = tokenizer([d["text"] for d in data], truncation=True, max_length=max_length)
+        self.labels = [label2id[d["label"]] for d in data]
 
     def __getitem__(self, idx):
-        item = {key: torch.tensor(val[idx]) for key, val in self.encodings.items()}
-        item['labels'] = torch.tensor(self.labels[idx])
+        item = {key: val[idx] for key, val in self.encodings.items()}
+        item['labels'] = self.labels[idx]
         return item
 
     def __len__(self):
         return len(self.labels)
 
-def train():
+
+def compute_metrics(eval_pred):
+    logits, labels = eval_pred
+    return evaluate(np.argmax(logits, axis=-1), labels)
+
+
+def evaluate(predictions, labels):
+    """Accuracy and macro F1 over the labels present in `labels`"""
+    predictions, labels = np.asarray(predictions), np.asarray(labels)
+    f1s = []
+    for label in np.unique(labels):
+        tp = np.sum((predictions == label) & (labels == label))
+        fp = np.sum((predictions == label) & (labels != label))
+        fn = np.sum((predictions != label) & (labels == label))
+        f1s.append(2 * tp / (2 * tp + fp + fn) if tp else 0.0)
+    return {
+        "accuracy": round(float(np.mean(predictions == labels)), 4) if len(labels) else None,
+        "macro_f1": round(float(np.mean(f1s)), 4) if f1s else None,
+    }
+
+
+# --- 2. FROZEN ENCODER (HEAD-ONLY) TRAINING ---
+
+def encode_features(model, tokenizer, texts, max_length=MAX_LENGTH, max_batch_tokens=FEATURE_BATCH_TOKENS):
+    """
+    The pooled [CLS] vector of every text, computed once with the encoder
+    frozen: exactly what the classification head sees at inference time.
+    Length-sorted, dynamically padded batches, as in ClauseClassifier.
+    """
+    encodings = tokenizer(list(texts), truncation=True, max_length=max_length)
+    lengths = [len(ids) for ids in encodings["input_ids"]]
+    order = sorted(range(len(texts)), key=lambda i: lengths[i])
+    features = [None] * len(texts)
+
+    def run(batch):
+        inputs = tokenizer.pad([{k: encodings[k][i] for k in encodings.keys()} for i in batch], return_tensors="pt")
+        # no_grad, not inference_mode: the features are reused under autograd
+        with torch.no_grad():
+            outputs = model.base_model(**inputs)
+        pooled = outputs.pooler_output if getattr(outputs, "pooler_output", None) is not None else outputs.last_hidden_state[:, 0]
+        for i, row in zip(batch, pooled):
+            features[i] = row
+
+    batch = []
+    for i in order:
+        if batch and lengths[i] * (len(batch) + 1) > max_batch_tokens:
+            run(batch)
+            batch = []
+        batch.append(i)
+    if batch:
+        run(batch)
+
+    return torch.stack(features) if features else torch.empty(0)
+
+
+def train_head(model, train_x, train_y, val_x, val_y, epochs, batch_size, learning_rate, seed):
+    """Trains only model.classifier (plus its dropout) on cached features"""
+    head = getattr(model, "classifier", None)
+    if not isinstance(head, torch.nn.Linear):
+        raise ValueError("--frozen needs a BERT-style model with a linear `classifier` head")
+    dropout = getattr(model, "dropout", torch.nn.Identity())
+
+    generator = torch.Generator().manual_seed(seed)
+    optimizer = torch.optim.AdamW(head.parameters(), lr=learning_rate)
+    train_y = torch.tensor(train_y)
+
+    for epoch in range(epochs):
+        head.train()
+        dropout.train()
+        permutation = torch.randperm(len(train_y), generator=generator)
+        total = 0.0
+        for start in range(0, len(train_y), batch_size):
+            idx = permutation[start:start + batch_size]
+            loss = torch.nn.functional.cross_entropy(head(dropout(train_x[idx])), train_y[idx])
+            optimizer.zero_grad()
+            loss.backward()
+            optimizer.step()
+            total += loss.item() * len(idx)
+
+        if (epoch + 1) % max(epochs // 10, 1) == 0 or epoch == epochs - 1:
+            line = f"   epoch {epoch + 1}/{epochs} | loss {total / len(train_y):.4f}"
+            if len(val_y):
+                line += f" | val {predict_head(model, val_x, val_y)}"
+            print(line)
+
+
+def head_predictions(model, features):
+    model.eval()
+    with torch.inference_mode():
+        return model.classifier(features).argmax(dim=-1).numpy()
+
+
+def predict_head(model, features, labels):
+    return evaluate(head_predictions(model, features), labels)
+
+
+# --- 3. TRAINING ---
+
+def train(args):
     print("🚀 Starting Training Process (Fine-Tuning InLegalBERT)...")
-    
-    # 1. Prepare Model & Tokenizer
-    tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME)
-    model = AutoModelForSequenceClassification.from_pretrained(MODEL_NAME, num_labels=5)
-    
-    dataset = LegalDataset(train_data, tokenizer)
-
-    # 2. Training Arguments
-    # Optimized for speed and accuracy on your machine
-    training_args = TrainingArguments(
-        output_dir='./results',
-        num_train_epochs=10,              # Increased to 10 for better learning
-        per_device_train_batch_size=4,    # Increased batch size slightly
-        logging_dir='./logs',
-        logging_steps=5,
-        save_strategy="no",
-        use_cpu=False if torch.cuda.is_available() else True
-    )
+    torch.manual_seed(args.seed)
+
+    # 1. Labels from the taxonomy; they are saved into the model config,
+    # which is where ClauseClassifier reads them back from
+    taxonomy, id2label, label2id = load_taxonomy(args.taxonomy)
+
+    # 2. Data: clean + dedup, then a stratified split
+    if args.data:
+        examples = read_examples(args.data)
+    else:
+        examples = [{"text": text, "label": label, "split": None} for text, label in train_data]
+    # Rows labeled cascade.NOISE (headers, signatures...) only train the prefilter
+    cleaned = clean_examples(examples, {**label2id, cascade.NOISE: None})
+    noise = [e for e in cleaned if e["label"] == cascade.NOISE]
+    splits = split_examples([e for e in cleaned if e["label"] != cascade.NOISE], args.seed)
+    print(f"📚 {len(splits['train'])} train / {len(splits['validation'])} validation / {len(splits['test'])} test examples")
 
-    # 3. The Trainer
-    trainer = Trainer(
-        model=model,
-        args=training_args,
-        train_dataset=dataset,
+    # 3. Prepare Model & Tokenizer
+    tokenizer = AutoTokenizer.from_pretrained(args.model)
+    model = AutoModelForSequenceClassification.from_pretrained(
+        args.model, num_labels=len(id2label), id2label=id2label, label2id=label2id
     )
+    model.config.taxonomy_version = taxonomy.get("version")
+
+    if args.frozen:
+        # 4a. Encoder runs once per example; only the head is trained
+        print("🧊 Frozen encoder: caching pooled features...")
+        model.eval()
+        features = {
+            name: encode_features(model, tokenizer, [d["text"] for d in data], args.max_length)
+            for name, data in splits.items()
+        }
+        labels = {name: [label2id[d["label"]] for d in data] for name, data in splits.items()}
+
+        print(f"🧠 Training the classification head for {args.head_epochs} epochs...")
+        train_head(model, features["train"], labels["train"], features["validation"], labels["validation"],
+                   args.head_epochs, args.batch_size, args.head_learning_rate, args.seed)
+        test_predictions = head_predictions(model, features["test"]) if labels["test"] else []
+        test_metrics = evaluate(test_predictions, labels["test"]) if labels["test"] else {}
+    else:
+        # 4b. Full fine-tuning with dynamic padding and length-grouped batches
+        datasets = {name: LegalDataset(data, tokenizer, label2id, args.max_length) for name, data in splits.items()}
+        training_args = TrainingArguments(
+            output_dir='./results',
+            num_train_epochs=args.epochs,
+            per_device_train_batch_size=args.batch_size,
+            per_device_eval_batch_size=args.batch_size * 2,
+            learning_rate=args.learning_rate,
+            group_by_length=True,                   # similar lengths share a batch -> little padding
+            dataloader_num_workers=args.workers,
+            eval_strategy="epoch" if len(datasets["validation"]) else "no",
+            save_strategy="no",
+            logging_dir='./logs',
+            logging_steps=10,
+            seed=args.seed,
+            report_to="none",
+            use_cpu=False if torch.cuda.is_available() else True
+        )
+        trainer = Trainer(
+            model=model,
+            args=training_args,
+            train_dataset=datasets["train"],
+            eval_dataset=datasets["validation"] if len(datasets["validation"]) else None,
+            data_collator=DataCollatorWithPadding(tokenizer),
+            compute_metrics=compute_metrics,
+        )
+
+        print(f"🧠 Training on {len(datasets['train'])} examples...")
+        trainer.train()
+        test_metrics, test_predictions = {}, []
+        if len(datasets["test"]):
+            output = trainer.predict(datasets["test"])
+            test_metrics = compute_metrics((output.predictions, output.label_ids))
+            test_predictions = np.argmax(output.predictions, axis=-1)
+
+    # 5. Held-out test set: used only for this final evaluation
+    if test_metrics:
+        print(f"🧪 Test set: {test_metrics}")
+
+    # 6. Save
+    print(f"💾 Saving fine-tuned model to {args.output}...")
+    if os.path.exists(args.output):
+        shutil.rmtree(args.output)
+
+    # safetensors weights are memory-mapped at load time (fast service startup)
+    model.save_pretrained(args.output, safe_serialization=True)
+    tokenizer.save_pretrained(args.output)
+
+    # 7. Cascade prefilter on the same split, saved next to the model
+    cascade_metrics = {}
+    if not args.no_cascade:
+        print("🪜 Training the cascade prefilter...")
+        # Routed as in the service, and checked against the risk rules
+        cascade_metrics = cascade.train_prefilter(
+            splits, list(id2label.values()), args.output, noise,
+            judge=RiskDetector(), reference=[id2label[int(i)] for i in test_predictions]
+        )
+        print(f"🪜 Cascade on the test set: {cascade_metrics}")
 
-    # 4. Train!
-    print(f"🧠 Training on {len(train_data)} examples...")
-    trainer.train()
-
-    # 5. Save
-    print(f"💾 Saving fine-tuned model to {OUTPUT_DIR}...")
-    if os.path.exists(OUTPUT_DIR):
-        shutil.rmtree(OUTPUT_DIR)
-    
-    model.save_pretrained(OUTPUT_DIR)
-    tokenizer.save_pretrained(OUTPUT_DIR)
+    with open(os.path.join(args.output, "eval.json"), "w") as f:
+        json.dump({"test": test_metrics, "cascade": cascade_metrics,
+                   "sizes": {k: len(v) for k, v in splits.items()}}, f, indent=2)
     print("✅ Training Complete. The 'Brain' is much smarter now.")
 
 if __name__ == "__main__":
-    train()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Fine-tune the clause classifier on the clause taxonomy.")
+    parser.add_argument("--data", help="Labeled clauses (.jsonl or .csv); default: the built-in examples")
+    parser.add_argument("--taxonomy", default=TAXONOMY_PATH)
+    parser.add_argument("--model", default=MODEL_NAME)
+    parser.add_argument("--output", default=OUTPUT_DIR)
+    # The built-in set is tiny: small batches and many epochs give the optimizer enough steps
+    parser.add_argument("--epochs", type=float, default=10)
+    parser.add_argument("--batch-size", type=int, default=4)
+    parser.add_argument("--learning-rate", type=float, default=5e-5)
+    parser.add_argument("--max-length", type=int, default=MAX_LENGTH)
+    parser.add_argument("--workers", type=int, default=min(4, os.cpu_count() or 1), help="DataLoader worker processes")
+    parser.add_argument("--frozen", action="store_true", help="Freeze the encoder: cache [CLS] features once, train the head only")
+    parser.add_argument("--head-epochs", type=int, default=50)
+    parser.add_argument("--head-learning-rate", type=float, default=1e-3)
+    parser.add_argument("--no-cascade", action="store_true", help="Don't train the cascade prefilter")
+    parser.add_argument("--seed", type=int, default=42)
+    train(parser.parse_args())
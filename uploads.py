@@ -0,0 +1,101 @@
+import hashlib
+import io
+import os
+import tempfile
+
+# --- CONFIGURATION ---
+# Uploads above this size are rejected while they stream in
+MAX_UPLOAD_BYTES = int(os.environ.get("LEGALLENS_MAX_UPLOAD_MB", 50)) * 1024 * 1024
+# Uploads up to this size never touch the disk; larger ones are spooled to
+# a temp file (outside the working directory) deleted by Document.close()
+SPOOL_BYTES = int(os.environ.get("LEGALLENS_SPOOL_MB", 8)) * 1024 * 1024
+
+CHUNK_SIZE = 1024 * 1024
+
+
+class UploadTooLarge(Exception):
+    """Raised mid-stream once an upload passes MAX_UPLOAD_BYTES (HTTP 413)"""
+
+
+class Document:
+    """
+    An uploaded document, either fully in memory (`data`) or spooled to a
+    temp file (`path`). `source` is what the OCR pipeline accepts.
+    """
+
+    def __init__(self, filename, content_hash, size, data=None, path=None):
+        self.filename = filename
+        self.content_hash = content_hash
+        self.size = size
+        self.data = data
+        self.path = path
+
+    @property
+    def source(self):
+        return self.data if self.data is not None else self.path
+
+    def close(self):
+        if self.path is not None:
+            _unlink(self.path)
+            self.path = None
+        self.data = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _unlink(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def receive(fileobj, filename, max_bytes=MAX_UPLOAD_BYTES, spool_bytes=SPOOL_BYTES):
+    """
+    Streams an upload in chunks: hashes it, enforces the size cap as it goes,
+    and keeps it in memory unless it grows past `spool_bytes`.
+    """
+    hasher = hashlib.sha256()
+    buffer = io.BytesIO()
+    spool = spool_path = None
+    head = b""
+    size = 0
+
+    try:
+        for chunk in iter(lambda: fileobj.read(CHUNK_SIZE), b""):
+            size += len(chunk)
+            if size > max_bytes:
+                raise UploadTooLarge(f"Upload exceeds the {max_bytes // (1024 * 1024)} MB limit")
+
+            hasher.update(chunk)
+            head = head or chunk[:5]
+
+            if spool is None and size > spool_bytes:
+                # Keep a recognisable suffix: pdf2image/pdfminer need a real path
+                suffix = ".pdf" if head.startswith(b"%PDF") else os.path.splitext(filename or "")[1]
+                # Not NamedTemporaryFile: on Windows no other process (pdftoppm,
+                # cv2.imread, the job copy) could open it while it is open here
+                fd, spool_path = tempfile.mkstemp(prefix="legallens_", suffix=suffix)
+                spool = os.fdopen(fd, "wb")
+                spool.write(buffer.getvalue())
+                buffer = None
+
+            if spool is not None:
+                spool.write(chunk)
+            else:
+                buffer.write(chunk)
+    except BaseException:
+        if spool is not None:
+            spool.close()
+            _unlink(spool_path)
+        raise
+
+    if spool is not None:
+        # Closed before the path is handed over; Document.close() deletes it
+        spool.close()
+        return Document(filename, hasher.hexdigest(), size, path=spool_path)
+    return Document(filename, hasher.hexdigest(), size, data=buffer.getvalue())